@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+
+#
+# Local fake Hue bridge to run hue_monitor.py without a real bridge
+#
+# serve:  HTTPS bridge with /clip/v2/resource(/device), per-resource GET/PUT and /eventstream/clip/v2.
+#         The events are replayed from a capture (see record) or generated for synthetic sensors
+# record: save the resources and the event stream of a real bridge to a capture file
+# bench:  run a fake bridge and the event loop of hue_monitor.Bridge against it, report events/sec
+#         and the latency from sending an event to its on_change callback
+#
+# Faults: --disconnect N drops the stream after every N events, --stall N:SECS stops sending for SECS
+# secs after every N events. Replay continues where the dropped stream stopped, no event is lost
+#
+# hue_monitor.py itself finds the bridge on port 443 and probes it on port 80 (needs root): run
+# "serve --port 443 --http-port 80" and set ip = 127.0.0.1 in its config file
+#
+# Examples:
+#   python3 hue_fakebridge.py record --ip 192.168.178.100 --key <key> --output evening.jsonl --duration 3600
+#   python3 hue_fakebridge.py serve --capture evening.jsonl --speed 10
+#   python3 hue_fakebridge.py bench --sensors 5 --events 5000 --rate 0 --disconnect 1000
+#
+
+import argparse
+import datetime
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Event, Lock, Thread
+
+#
+# Synthetic sensors: services with their resource section and initial state
+#
+SERVICES = (
+    ("device_power", "power_state", { "battery_level": 90, "battery_state": "normal" }),
+    ("light_level",  "light",       { "light_level_report": { "light_level": 10000, "changed": None } }),
+    ("temperature",  "temperature", { "temperature_report": { "temperature": 21.0, "changed": None } }),
+    ("motion",       "motion",      { "motion_report": { "motion": False, "changed": None } })
+)
+
+#
+# Secs. to wait for the fake bridge to accept connections
+#
+STARTTIMEOUT = 10
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def restamp(obj, stamp):
+    # Set all "changed" and "creationtime" timestamps to the time the event is sent
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key in ("changed", "creationtime"):
+                obj[key] = stamp
+            else:
+                restamp(value, stamp)
+    elif isinstance(obj, list):
+        for value in obj:
+            restamp(value, stamp)
+
+    return obj
+
+
+def synthetic_resources(sensors):
+    stamp = utc_now()
+    resources = [ { "id": "bridge", "type": "device", "product_data": { "product_name": "Hue Bridge" }, "metadata": { "name": "Fake Bridge" }, "services": [] } ]
+
+    for i in range(sensors):
+        services = []
+
+        for name, section, state in SERVICES:
+            resource = { "id": f"{name}-{i}", "type": name, "owner": { "rid": f"sensor-{i}", "rtype": "device" }, section: restamp(json.loads(json.dumps(state)), stamp) }
+            if name != "device_power":
+                resource["enabled"] = True
+
+            resources.append(resource)
+            services.append({ "rid": resource["id"], "rtype": name })
+
+        resources.append({ "id": f"sensor-{i}", "type": "device", "product_data": { "product_name": "Hue motion sensor" }, "metadata": { "name": f"Sensor {i}" }, "services": services })
+
+    return resources
+
+
+def synthetic_events(sensors, events, rate):
+    # (offset in secs, data) of a stream with temperature, light level and motion updates in turn
+    for k in range(events):
+        i, kind = k % sensors, (k // sensors) % 3
+
+        if kind == 0:
+            name, section, state = "temperature", "temperature", { "temperature_report": { "temperature": 20 + k % 50 / 10, "changed": None } }
+        elif kind == 1:
+            name, section, state = "light_level", "light", { "light_level_report": { "light_level": 10000 + k % 500, "changed": None } }
+        else:
+            name, section, state = "motion", "motion", { "motion_report": { "motion": bool(k % 2), "changed": None } }
+
+        update = { "id": f"{name}-{i}", "type": name, "owner": { "rid": f"sensor-{i}", "rtype": "device" }, section: state }
+
+        yield (k / rate if rate else 0, [ { "creationtime": None, "id": str(k), "type": "update", "data": [ update ] } ])
+
+
+def read_capture(path):
+    # First line: { "resources": [...] }, then one { "t": offset in secs, "data": [...] } per frame
+    with open(path, encoding="utf-8") as f:
+        resources = json.loads(f.readline())["resources"]
+        frames = [ (frame["t"], frame["data"]) for frame in map(json.loads, f) ]
+
+    return resources, frames
+
+
+class FakeBridge():
+    # The state of the fake bridge: resources and the position of the replayed stream
+
+    def __init__(self, resources, frames, speed=1.0, disconnect=0, stall=None):
+        self.resources  = { resource["id"]: resource for resource in resources }
+        self.frames     = frames
+        self.speed      = speed
+        self.disconnect = disconnect
+        self.stall      = stall          # (every N events, secs)
+        self.position   = 0
+        self.lock       = Lock()
+        self.stats      = { "streams": 0, "sent": 0, "disconnects": 0, "stalls": 0, "rest": 0, "put": 0 }
+
+    def next_frame(self):
+        with self.lock:
+            if self.position >= len(self.frames):
+                return None
+
+            self.position += 1
+            return self.position - 1, self.frames[self.position - 1]
+
+
+def handler(bridge):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, obj, status=200):
+            body = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            # New application key
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_json([ { "success": { "username": "fake", "clientkey": "fake" } } ])
+
+        def do_PUT(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = self.path.rstrip("/").split("/")
+            resource = bridge.resources.get(path[-1])
+
+            if not resource:
+                return self.send_json({ "errors": [ { "description": "not found" } ], "data": [] }, 404)
+
+            resource.update(body)
+            bridge.stats["put"] += 1
+            self.send_json({ "errors": [], "data": [ { "rid": resource["id"], "rtype": resource["type"] } ] })
+
+        def do_GET(self):
+            path = self.path.rstrip("/").split("/")
+
+            if self.path.startswith("/eventstream/clip/v2"):
+                return self.stream()
+            if self.path == "/fake/stats":
+                return self.send_json(dict(bridge.stats, position=bridge.position, frames=len(bridge.frames)))
+
+            bridge.stats["rest"] += 1
+
+            if self.path == "/clip/v2/resource":
+                return self.send_json({ "errors": [], "data": list(bridge.resources.values()) })
+            if len(path) == 5 and path[4] == "device":
+                return self.send_json({ "errors": [], "data": [ r for r in bridge.resources.values() if r["type"] == "device" ] })
+            if len(path) == 6 and path[5] in bridge.resources:
+                return self.send_json({ "errors": [], "data": [ bridge.resources[path[5]] ] })
+
+            self.send_json({ "errors": [ { "description": "not found" } ], "data": [] }, 404)
+
+        def chunk(self, data):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def stream(self):
+            bridge.stats["streams"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            start, first = time.monotonic(), None
+
+            while True:
+                frame = bridge.next_frame()
+                if frame is None:
+                    # Like the real bridge: keep the stream open without events
+                    time.sleep(1)
+                    continue
+
+                index, (offset, data) = frame
+                first = offset if first is None else first
+
+                if bridge.speed:
+                    delay = (offset - first) / bridge.speed - (time.monotonic() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                stamp = utc_now()
+                payload = json.dumps(restamp(json.loads(json.dumps(data)), stamp)).encode()
+
+                try:
+                    self.chunk(b"id: %d:0\ndata: %s\n\n" % (index, payload))
+                except OSError:
+                    # Client gone: the frame is sent again on the next stream
+                    with bridge.lock:
+                        bridge.position = min(bridge.position, index)
+                    return
+
+                with bridge.lock:
+                    bridge.stats["sent"] += 1
+                    sent = bridge.stats["sent"]
+
+                if bridge.stall and sent % bridge.stall[0] == 0:
+                    bridge.stats["stalls"] += 1
+                    time.sleep(bridge.stall[1])
+
+                if bridge.disconnect and sent % bridge.disconnect == 0:
+                    # Drop the connection without the terminating chunk
+                    bridge.stats["disconnects"] += 1
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+
+    return Handler
+
+
+def certificate(cert=None, key=None):
+    # A self-signed certificate unless one is specified
+    if cert and key:
+        return cert, key
+
+    folder = tempfile.mkdtemp(prefix="hue_fakebridge")
+    cert, key = os.path.join(folder, "cert.pem"), os.path.join(folder, "key.pem")
+
+    subprocess.run([ "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=fakebridge",
+                     "-keyout", key, "-out", cert ], check=True, capture_output=True)
+
+    return cert, key
+
+
+def serve(args, ready=None):
+    if args.capture:
+        resources, frames = read_capture(args.capture)
+    else:
+        resources, frames = synthetic_resources(args.sensors), list(synthetic_events(args.sensors, args.events, args.rate))
+
+    stall = tuple(map(float, args.stall.split(":"))) if args.stall else None
+    bridge = FakeBridge(resources, frames, speed=args.speed, disconnect=args.disconnect, stall=(int(stall[0]), stall[1]) if stall else None)
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate(args.cert, args.key))
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler(bridge))
+    server.daemon_threads = True
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    if args.http_port:
+        # Answers the plain http probe of the bridge discovery
+        class Probe(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_GET = do_HEAD
+
+        probe = ThreadingHTTPServer(("127.0.0.1", args.http_port), Probe)
+        probe.daemon_threads = True
+        Thread(target=probe.serve_forever, name="probe", daemon=True).start()
+
+    print(f"Fake bridge on https://127.0.0.1:{args.port}: {sum(1 for r in resources if r['type'] == 'device') - 1} sensors, {len(frames)} frames", flush=True)
+
+    if ready:
+        ready.set()
+
+    server.serve_forever()
+
+
+def record(args):
+    # Save the resources and then every frame of the event stream with its offset in secs
+    import requests
+    from urllib3.exceptions import InsecureRequestWarning
+
+    requests.packages.urllib3.disable_warnings(category=InsecureRequestWarning)
+    headers = { "hue-application-key": args.key }
+
+    response = requests.get(f"https://{args.ip}/clip/v2/resource", headers=headers, timeout=10, verify=False)
+    response.raise_for_status()
+
+    frames = 0
+    start = time.monotonic()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(json.dumps({ "resources": response.json()["data"] }) + "\n")
+
+        try:
+            with requests.get(f"https://{args.ip}/eventstream/clip/v2", headers=dict(headers, Accept="text/event-stream"), stream=True, timeout=(10, None), verify=False) as stream:
+                for line in stream.iter_lines():
+                    if line.startswith(b"data:"):
+                        f.write(json.dumps({ "t": round(time.monotonic() - start, 3), "data": json.loads(line[5:]) }) + "\n")
+                        f.flush()
+                        frames += 1
+
+                    if args.duration and time.monotonic() - start >= args.duration:
+                        break
+
+        except KeyboardInterrupt:
+            pass
+
+    print(f"{frames} frames recorded in {time.monotonic() - start:.0f} secs: {args.output}")
+
+
+def bench(args):
+    # Fake bridge in a child process, hue_monitor's event loop in this one
+    import hue_monitor
+
+    options = { "--port": args.port, "--http-port": args.http_port, "--capture": args.capture, "--sensors": args.sensors, "--events": args.events, "--rate": args.rate,
+                "--speed": args.speed, "--disconnect": args.disconnect, "--stall": args.stall, "--cert": args.cert, "--key": args.key }
+
+    child = subprocess.Popen([ sys.executable, os.path.abspath(__file__), "serve" ] + [ str(arg) for option, value in options.items() if value is not None for arg in (option, value) ],
+                             stdout=subprocess.PIPE, text=True)
+
+    try:
+        child.stdout.readline()
+
+        frames = read_capture(args.capture)[1] if args.capture else None
+        updates = sum(len(container.get("data", [])) for _, data in frames for container in data if container.get("type") == "update") if frames else args.events
+
+        # Retry the dropped stream after 1 sec instead of WAITTIME
+        hue_monitor.WAITTIME = args.wait
+
+        latencies = []
+        done = Event()
+
+        def on_change(bridge, sensor, service, changed, value):
+            latencies.append((datetime.datetime.now() - changed).total_seconds())
+            if len(latencies) >= updates:
+                done.set()
+
+        ip = f"127.0.0.1:{args.port}"
+        deadline = time.monotonic() + STARTTIMEOUT
+        while not hue_monitor.isOpen("127.0.0.1", args.port) and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+        # The log output of the monitor costs time as well, but it is not shown
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+
+        try:
+            bridge = hue_monitor.Bridge(ip, username="fake", onchange=on_change, asynchronous=args.asynchronous)
+
+            start = time.monotonic()
+            Thread(target=bridge.events, name="events", daemon=True).start()
+
+            done.wait(args.timeout)
+            elapsed = time.monotonic() - start
+        finally:
+            sys.stdout = stdout
+
+        import requests
+        stats = requests.get(f"https://{ip}/fake/stats", timeout=5, verify=False).json()
+
+        latencies.sort()
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else float("nan")
+
+        print(f"{len(latencies)}/{updates} updates in {elapsed:.2f} secs: {len(latencies) / elapsed:.0f} events/sec, "
+              f"latency p50 {percentile(0.5):.2f} ms, p95 {percentile(0.95):.2f} ms, p99 {percentile(0.99):.2f} ms, max {percentile(1.0):.2f} ms")
+        print(f"streams {stats['streams']}, disconnects {stats['disconnects']}, stalls {stats['stalls']}, REST calls {stats['rest']}")
+
+        return 0 if len(latencies) >= updates else 1
+
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake Hue bridge: serve, record and benchmark event streams")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("serve", "bench"):
+        command = commands.add_parser(name)
+        command.add_argument("--port", type=int, default=8443)
+        command.add_argument("--http-port", type=int, default=0, help="answer plain http probes on this port (0 = none)")
+        command.add_argument("--capture", help="replay a recorded capture instead of synthetic events")
+        command.add_argument("--sensors", type=int, default=3, help="synthetic sensors")
+        command.add_argument("--events", type=int, default=1000, help="synthetic events")
+        command.add_argument("--rate", type=float, default=10, help="synthetic events per sec. (0 = as fast as possible)")
+        command.add_argument("--speed", type=float, default=1.0, help="replay speed (0 = as fast as possible)")
+        command.add_argument("--disconnect", type=int, default=0, help="drop the stream after every N events")
+        command.add_argument("--stall", help="N:SECS - pause SECS secs. after every N events")
+        command.add_argument("--cert")
+        command.add_argument("--key")
+
+    commands.choices["bench"].add_argument("--async", dest="asynchronous", action="store_true", help="use the asyncio client")
+    commands.choices["bench"].add_argument("--wait", type=float, default=1, help="secs. before a dropped stream is retried")
+    commands.choices["bench"].add_argument("--timeout", type=float, default=300, help="max. secs. of the benchmark")
+
+    command = commands.add_parser("record")
+    command.add_argument("--ip", required=True)
+    command.add_argument("--key", required=True)
+    command.add_argument("--output", required=True)
+    command.add_argument("--duration", type=float, default=0, help="secs. (0 = until Ctrl-C)")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+    elif args.command == "record":
+        record(args)
+    else:
+        sys.exit(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 
 import requests
 import json
+import csv
 import sys
 import time
 import smtplib
@@ -14,17 +15,30 @@ import signal
 #import ssl
 import datetime
 import io
+import asyncio
+import functools
+import bisect
+import sqlite3
+import multiprocessing
+import threading
+import queue
+import atexit
 
 #install with sudo pip3 install pandas or sudo apt install python3-pandas
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+#pandas, numpy and matplotlib are imported where they are needed (reports, csv restore), not at startup
 
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning
 
-from threading import Timer
+from threading import Timer, Thread, Lock, Event
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
 from mimetypes import guess_type
+from html import escape
+from types import MappingProxyType, SimpleNamespace
 
 from email.utils import formataddr, make_msgid
 from email.header import Header
@@ -32,6 +46,12 @@ from email.message import EmailMessage
 
 from zeroconf import ServiceBrowser, Zeroconf, ServiceListener
 
+# zoneinfo requires Python 3.9+, else fall back to the system's local time conversion
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
 #
 # Suppress only the single warning from urllib3 needed.
 #
@@ -52,13 +72,87 @@ MAXRETRIES = 5
 WAITTIME = 60
 TIMEOUT = 60
 
-plt.rc('font', size=SMALL_SIZE)          # controls default text sizes
-plt.rc('axes', titlesize=SMALL_SIZE)     # fontsize of the axes title
-plt.rc('axes', labelsize=MEDIUM_SIZE)    # fontsize of the x and y labels
-plt.rc('xtick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
-plt.rc('ytick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
-plt.rc('legend', fontsize=SMALL_SIZE)    # legend fontsize
-plt.rc('figure', titlesize=BIGGER_SIZE)  # fontsize of the figure title
+#
+# REST calls:
+# (connect, read) timeout in secs and max. number of pooled keep-alive connections per bridge
+#
+RESTTIMEOUT = (3, 5)
+POOLSIZE = 4
+
+#
+# Discovery:
+# Max. time in secs to find the bridge, interval in secs between probes of known ip addresses,
+# consecutive event stream failures before a new ip address is searched and the cloud discovery endpoint
+#
+DISCOVERYTIMEOUT = 30
+PROBEINTERVAL = 2
+REDISCOVERY = 2
+DISCOVERYURL = "https://discovery.meethue.com/"
+
+#
+# Reports:
+# Max. time in secs for the report process (rendering and mail) before it is killed
+#
+REPORTTIMEOUT = 600
+
+#
+# Notifications:
+# Max. queued notifications (more are spilled to disk), number of delivery threads, delivery attempts,
+# wait in secs before the first retry (doubled per retry up to NOTIFYMAXWAIT) and timeout in secs per target
+#
+NOTIFYQUEUE = 100
+NOTIFYWORKERS = 2
+NOTIFYRETRIES = 5
+NOTIFYBACKOFF = 2
+NOTIFYMAXWAIT = 300
+NOTIFYTIMEOUT = { "ntfy": 10, "smtp": 30 }
+
+#
+# Mail:
+# Secs. between NOOPs keeping the SMTP session alive and max. idle secs. before the session is closed
+#
+SMTPKEEPALIVE = 60
+SMTPIDLE = 600
+
+#
+# Motion alerts:
+# Secs. before pending alerts are sent again after an error
+#
+ALERTRETRY = 60
+
+#
+# Profiling:
+# Durations kept per stage for the percentiles, secs. and interval in secs. of the sampling profile (SIGUSR1)
+#
+STAGEWINDOW = 10000
+PROFILESECS = 10
+PROFILEINTERVAL = 0.005
+
+def aiohttp_client():
+    # aiohttp is needed for the asyncio client only (sudo pip3 install aiohttp): imported if enabled, None if not installed
+    try:
+        import aiohttp
+    except ImportError:
+        return None
+
+    return aiohttp
+
+
+@functools.lru_cache(maxsize=None)
+def pyplot():
+    # matplotlib takes seconds and tens of MB on a Raspberry Pi: imported and set up on the first plot only
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    plt.rc('font', size=SMALL_SIZE)          # controls default text sizes
+    plt.rc('axes', titlesize=SMALL_SIZE)     # fontsize of the axes title
+    plt.rc('axes', labelsize=MEDIUM_SIZE)    # fontsize of the x and y labels
+    plt.rc('xtick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
+    plt.rc('ytick', labelsize=SMALL_SIZE)    # fontsize of the tick labels
+    plt.rc('legend', fontsize=SMALL_SIZE)    # legend fontsize
+    plt.rc('figure', titlesize=BIGGER_SIZE)  # fontsize of the figure title
+
+    return plt, mdates
 
 #
 # Handle SIGTERM signal
@@ -69,6 +163,13 @@ def sigterm_handler(_signo, _stack_frame):
 signal.signal(signal.SIGINT, sigterm_handler)
 signal.signal(signal.SIGTERM, sigterm_handler)
 
+def sigusr1_handler(_signo, _stack_frame):
+    # Dump the stage timers and a sampling profile, the monitor keeps running
+    Thread(target=dump_profile, name="profile", daemon=True).start()
+
+if hasattr(signal, "SIGUSR1"):
+    signal.signal(signal.SIGUSR1, sigusr1_handler)
+
 #
 # Motion profile has 24 hrs. with a 15 min. time grid
 # ==> 96 discrete values (on/off) per day
@@ -116,6 +217,11 @@ date_out_format = f"{day_format} {time_format}"
 
 day_format_long = "%a, %d.%m.%y"
 
+#
+# Reference for naive UTC datetime objects
+#
+EPOCH = datetime.datetime(1970, 1, 1)
+
 today = datetime.datetime.now().strftime(day_format)
 
 #
@@ -131,25 +237,33 @@ HueServices = {
         "description":   "Battery Level",
         "section":       "power_state",
         "value":         "battery_level",
-        "unit":          "%"
+        "unit":          "%",
+        "type":          int,
+        "compression":   None
     },
     "light_level": {
         "description":   "Licht Sensor",
         "section":       "light",
         "value":         "light_level",
-        "unit":          "Lux"
+        "unit":          "Lux",
+        "type":          int,
+        "compression":   None
     },
     "temperature": {
         "description":   "Temperature Sensor",
         "section":       "temperature",
         "value":         "temperature",
-        "unit":          "°C"
+        "unit":          "°C",
+        "type":          float,
+        "compression":   None
     },
     "motion": {
         "description":   "Motion Sensor",
         "section":       "motion",
         "value":         "motion",
-        "unit":          ""
+        "unit":          "",
+        "type":          bool,
+        "compression":   None
     }
 }
 
@@ -158,10 +272,12 @@ LOGsettings = {
     "motion_detected":   "Motion detected by sensor {}",
     "msg_sent":          "Message sent",
     "msg_failed":        "Message delivery failed: {}",
+    "report_failed":     "Report process failed: {}",
     "msg_suspended ":    "Message delivery suspended at specified time interval",
     "cfg_not_found":     "Configuration file not found: {}",
     "cfg_write_error":   "Error writing configuration: {}",
     "cfg_read_error":    "Error reading configuration: {}",
+    "cfg_reloaded":      "Configuration reloaded: {}",
     "invalid_response":  "Invalid response from {}",
     "timeout":           "Connection to {} timed out",
     "exception":         "Unexpected error: {}",
@@ -178,7 +294,14 @@ LOGsettings = {
     "monitor_started":   "The monitoring service has started",
     "monitor_not_ready": "The Hue Bridge is not reachable. The monitoring service was stopped",
     "monitor_failed":    "The monitoring service stopped due to an expected  error ({})",
-    "monitor_stopped":   "The monitoring service was stopped by the user or by the system"
+    "monitor_stopped":   "The monitoring service was stopped by the user or by the system",
+    "compressed":        "Compression (stored/received points): {}",
+    "journal_replayed":  "Reporting unreported data from the journal for date {}",
+    "notifications":     "Notifications: {}",
+    "alerts":            "Motion alerts (events/alerts sent/events held back): {}",
+    "metrics":           "Metrics available at http://{}/metrics",
+    "profile":           "Profile written to {}",
+    "invalid_compression": "Invalid compression setting: {}"
 }
 
 REPORTsettings = {
@@ -190,15 +313,42 @@ REPORTsettings = {
     "suppress_period":   "Suppress notifications (Period): {}",
     "suppress_daily":    "Suppress notifications (Daily): {}",
     "motion_profile":    "Motion Detection Profile (All Sensors)",
+    "sensor_motion":     "Motion Detection Profile: {} ({} events)",
+    "motion_heatmap":    "Motion Detection Heatmap (last {} days)",
     "source":            "Source",
     "on":                "On",
-    "off":               "Off"
+    "off":               "Off",
+    "weekly_subject":    "Weekly Report {} - {}",
+    "monthly_subject":   "Monthly Report {} - {}",
+    "summary_header":    "Sensor data from {} to {}",
+    "summary_temp":      "Temperature per hour (min. / mean / max.)",
+    "summary_motion":    "Motion events per day",
+    "summary_battery":   "Battery level per day",
+    "hour":              "Hour",
+    "day":               "Day"
 }
 
 DATAsettings = {
     "report_to":         [],
     "attach":		 True,
-    "store":		 None
+    "store":		 None,
+    "capacity":          0,      # max. data points per service (0 = unbounded), oldest points are dropped
+    "export":            None,   # directory for csv files if store is an SQLite database (*.db)
+    "batch":             100,    # SQLite: max. number of buffered inserts ...
+    "flush":             5,      # ... or max. secs. before buffered inserts are written
+    "journal":           None,   # path of the event journal (write-ahead log), no journal if empty
+    "journal_sync":      1.0,    # max. secs. between fsyncs of the journal ...
+    "journal_batch":     50,     # ... or max. number of unsynced events
+    "monitor_only":      False,  # no reports, no csv restore: pandas and matplotlib are never loaded
+    "charts":            "svg",  # chart backend of the report: "svg" (built-in) or "matplotlib" (PNG)
+    "bin_width":         15,     # motion profile: minutes per bar (1, 5, 15, 60, ...)
+    "heatmap_days":      0,      # motion heatmap (day x time of day) of the last days, 0 = none
+    "summaries":         [],     # "weekly" and/or "monthly" summary reports
+    "summary_cache":     None,   # file of the cached daily aggregates, default: next to the store
+    "notify_spill":      None,   # file of the notifications which didn't fit into the queue, default: next to the config file
+    "metrics":           None,   # [address:]port of the Prometheus /metrics endpoint, none if empty
+    "stage_timers":      False,  # time the stages of the event loop and the report (dumped with SIGUSR1)
+    "profile":           None    # directory of the dumps (SIGUSR1), default: next to the config file
 }
 
 SMTPsettings = {
@@ -206,14 +356,20 @@ SMTPsettings = {
     "name":              "Hue Bridge",
     "password":          "password",
     "server":            "smtp.mail.com",
-    "port":              587
+    "port":              587,
+    "starttls":          True
 }
 
 HUEsettings = {
+    "section":           "Hue Bridge",
     "ip":                "10.1.1.2",
-    "key":               None
+    "last_ip":           None,
+    "key":               None,
+    "async":             False,
+    "store":             None
 }
 
+
 MOTIONsettings = {
     "notify":            False,
     "notify_to":         "",
@@ -221,7 +377,12 @@ MOTIONsettings = {
     "notify_text":       "Sensor \"{}\" detected a motion at {}.",
     "except":            "",
     "except_daily":      "",
-    "suspend":           True
+    "suspend":           True,
+    "coalesce":          0,      # secs. in which motion events are collected into one alert, 0 = an alert per event
+    "rate":              0,      # max. alerts per hour per sensor (token bucket), 0 = unlimited ...
+    "burst":             1,      # ... with up to burst alerts at once
+    "total_rate":        0,      # [Motion Alert] only: max. alerts per hour of all sensors, 0 = unlimited
+    "digest":            0       # [Motion Alert] only: one alert with all events every digest minutes, 0 = none
 }
 
 
@@ -263,136 +424,339 @@ def isOpen(ip, port, timeout=3):
         s.close()
 
 
-def read_config():
-    if not os.path.exists(config_file):
-        log("cfg_not_found", argument=config_file)
-        return None
+class Schedule():
+    # Suppression periods ("except") and daily recurring periods ("except_daily") compiled once
+    # into sorted, merged intervals. Lookups are done by bisection. Interval ends are inclusive
 
-    config = None
+    __slots__ = ("starts", "ends", "daily_starts", "daily_ends")
 
-    try:
-        config = ConfigParser()
-        config.read([os.path.abspath(config_file)])
+    def __init__(self, periods="", daily=""):
+        intervals = []
 
-        #
-        # Hue Bridge IP and User Name/API Key
-        #
-        HUEsettings["ip"]  = config.get("Hue Bridge", "ip")
-        HUEsettings["key"] = config.get("Hue Bridge", "key")
+        # "%d.%m.%y %H:%M:%S - %d.%m.%y %H:%M:%S" with %H, %M, or %S being optional
+        for first, last in self.__split(periods):
+            try:
+                intervals.append((datetime.datetime.strptime(first, date_out_format[:len(first)]), datetime.datetime.strptime(last, date_out_format[:len(last)])))
+            except ValueError:
+                log("cfg_read_error", argument=f"{first} - {last}")
 
-        #
-        # Mail account settings
-        #
-        for option in config.options("Mail Account"):
-            value = config.get("Mail Account", option)
-            if value:
-                SMTPsettings[option] = value
+        self.starts, self.ends = self.__merge(intervals)
 
-        #
-        # Data handling settings
-        # If receivers ("report_to") list is empty, no E-mail will be sent
-        #
-        for option in config.options("Data Handling"):
-            value = config.get("Data Handling", option)
-            if value:
-                if option == "attach":
-                    DATAsettings[option] = config.getboolean("Data Handling", option)
-                elif option == "report_to" and "@" in value:
-                    DATAsettings[option] = [ r.strip() for r in value.split(',') ]
+        intervals = []
+
+        # "%H:%M:%S - %H:%M:%S" in seconds of the day, overnight periods (e.g. 22:00 - 06:00) are split at midnight
+        for first, last in self.__split(daily):
+            try:
+                start = self.__seconds(datetime.datetime.strptime(first, time_format[:len(first)]))
+                end   = self.__seconds(datetime.datetime.strptime(last, time_format[:len(last)]))
+            except ValueError:
+                log("cfg_read_error", argument=f"{first} - {last}")
+                continue
+
+            if start <= end:
+                intervals.append((start, end))
+            else:
+                intervals.append((start, 86399))
+                intervals.append((0, end))
+
+        self.daily_starts, self.daily_ends = self.__merge(intervals)
+
+    def __split(self, value):
+        for item in (value or "").split(","):
+            if item.strip():
+                first, _, last = item.partition("-")
+
+                if first.strip() and last.strip():
+                    yield first.strip(), last.strip()
                 else:
-                    DATAsettings[option] = value
+                    log("cfg_read_error", argument=item.strip())
+
+    def __seconds(self, when):
+        return when.hour * 3600 + when.minute * 60 + when.second
+
+    def __merge(self, intervals):
+        starts, ends = [], []
+
+        for start, end in sorted(intervals):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        return starts, ends
+
+    def __contains__(self, when):
+        # Times are compared with a resolution of seconds
+        when = when.replace(microsecond=0)
+
+        i = bisect.bisect_right(self.starts, when) - 1
+        if i >= 0 and when <= self.ends[i]:
+            return True
 
+        seconds = self.__seconds(when)
+
+        i = bisect.bisect_right(self.daily_starts, seconds) - 1
+        return i >= 0 and seconds <= self.daily_ends[i]
+
+
+class Config():
+    # Immutable snapshot of all settings, parsed once from the config file.
+    # The options of the config file are layered over the defaults above
+
+    def __init__(self, path=None):
+        self.path   = path
+        self.mtime  = None
+        self.valid  = False
+        self.parser = ConfigParser()
+
+        hue       = dict(HUEsettings)
+        bridges   = []
+        smtp      = dict(SMTPsettings)
+        data      = dict(DATAsettings)
+        motion    = dict(MOTIONsettings)
+        logging   = dict(LOGsettings)
+        reporting = dict(REPORTsettings)
+        services  = { name: dict(properties) for name, properties in HueServices.items() }
+        sensors   = {}
+
+        if path:
+            try:
+                self.mtime = os.stat(path).st_mtime
+
+                config = self.parser
+                config.read([os.path.abspath(path)])
+
+                #
+                # Hue Bridge IP and User Name/API Key
+                # Any number of sections "[Hue Bridge]", "[Hue Bridge <site>]", ... may be specified
+                #
+                for section in config.sections():
+                    if section != "Hue Bridge" and not section.startswith("Hue Bridge "):
+                        continue
+
+                    settings = dict(HUEsettings)
+                    settings["section"] = section
+                    settings["ip"]      = config.get(section, "ip")
+                    settings["last_ip"] = config.get(section, "last_ip", fallback=None)
+                    settings["key"]     = config.get(section, "key", fallback=None)
+                    settings["async"]   = config.getboolean(section, "async", fallback=False)
+                    settings["store"]   = config.get(section, "store", fallback=None)
+
+                    bridges.append(settings)
+
+                # The first bridge is the default bridge
+                hue.update(bridges[0])
+
+                #
+                # Mail account settings
+                #
+                for option in config.options("Mail Account"):
+                    value = config.get("Mail Account", option)
+                    if value:
+                        if option == "starttls":
+                            smtp[option] = config.getboolean("Mail Account", option)
+                        else:
+                            smtp[option] = value
+
+                #
+                # Data handling settings
+                # If receivers ("report_to") list is empty, no E-mail will be sent
+                #
+                for option in config.options("Data Handling"):
+                    value = config.get("Data Handling", option)
+                    if value:
+                        if option in ("attach", "monitor_only", "stage_timers"):
+                            data[option] = config.getboolean("Data Handling", option)
+                        elif option in ("capacity", "batch", "journal_batch", "bin_width", "heatmap_days"):
+                            data[option] = config.getint("Data Handling", option)
+                        elif option in ("flush", "journal_sync"):
+                            data[option] = config.getfloat("Data Handling", option)
+                        elif option == "report_to" and "@" in value:
+                            data[option] = [ r.strip() for r in value.split(',') ]
+                        elif option == "summaries":
+                            data[option] = [ r.strip().lower() for r in value.split(',') ]
+                        else:
+                            data[option] = value
+
+                #
+                # Set notify on motion events to True if you want alert meesages on motion detection
+                # except dates specify periods when no alert is sent
+                #
+                if config.has_section("Motion Alert"):
+                    self.__motion(config, "Motion Alert", motion)
+
+                #
+                # Customized service descriptions
+                #
+                for service in services:
+                    value = config.get("Service Descriptions", service)
+                    if value:
+                        services[service]["description"] = value
+
+                #
+                # Lossy compression of the services at ingestion, motion is always stored lossless
+                #
+                if config.has_section("Compression"):
+                    self.__compression(config, "Compression", services)
+
+                #
+                # Customized settings for logging
+                #
+                for option in config.options("Logging"):
+                    value = config.get("Logging", option)
+                    if value:
+                        logging[option] = value
+
+                #
+                # Customized settings for reporting
+                #
+                for option in config.options("Reporting"):
+                    value = config.get("Reporting", option)
+                    if value:
+                        reporting[option] = value
+
+                #
+                # Individual sensor settings: sections named like the sensor, layered over [Motion Alert]
+                #
+                for section in config.sections():
+                    if section in self.sections or section.startswith("Hue Bridge "):
+                        continue
+
+                    sensors[section] = self.__motion(config, section, dict(motion))
+
+                self.valid = True
+
+            except Exception as e:
+                log("cfg_read_error", argument=e)
+
+        self.hue      = MappingProxyType(hue)
+        self.bridges  = tuple(MappingProxyType(settings) for settings in bridges)
+        self.smtp     = MappingProxyType(smtp)
+        self.data     = MappingProxyType(data)
+        self.log      = MappingProxyType(logging)
+        self.report   = MappingProxyType(reporting)
+        self.services = MappingProxyType({ name: MappingProxyType(properties) for name, properties in services.items() })
+
+        # Compile the suppression periods once
+        motion["schedule"] = Schedule(motion["except"], motion["except_daily"])
+        self.motion   = MappingProxyType(motion)
+
+        for name, settings in sensors.items():
+            settings["schedule"] = Schedule(settings["except"], settings["except_daily"])
+            sensors[name] = MappingProxyType(settings)
+
+        self.sensors  = MappingProxyType(sensors)
+
+    # Sections which are not sensor names
+    sections = ("Hue Bridge", "Mail Account", "Data Handling", "Motion Alert", "Logging", "Reporting", "Service Descriptions", "Compression")
+
+    def __compression(self, config, section, services):
         #
-        # Set notify on motion events to True if you want alert meesages on motion detection
-        # except dates specify periods when no alert is sent
+        # <service> = deadband|swingingdoor <tolerance>[%] [<heartbeat>]
+        # with an absolute tolerance or a tolerance relative to the last stored value (%), and
+        # max. secs. between stored points (heartbeat, default: option heartbeat of the section, 0 = none)
         #
-        if config.has_section("Motion Alert"):
-            #for option in ("notify", "suspend", "except", "except_daily"):
-            for option in config.options("Motion Alert"):
-                value = config.get("Motion Alert", option)
-                if value:
-                    if option == "notify" or option == "suspend":
-                        MOTIONsettings[option] = config.getboolean("Motion Alert", option)
-                    elif option == "notify_to" and "@" in value:
-                        MOTIONsettings[option] = [ r.strip() for r in value.split(',') ]
-                    else:
-                        MOTIONsettings[option] = value
+        heartbeat = config.getint(section, "heartbeat", fallback=0)
+
+        for option in config.options(section):
+            value = config.get(section, option, raw=True)
+            if option == "heartbeat" or not value:
+                continue
+
+            try:
+                method, tolerance, *gap = value.lower().split()
+                if option not in services or services[option]["type"] is bool or method not in Compressor.methods:
+                    raise ValueError(option)
+
+                relative  = tolerance.endswith("%")
+                tolerance = float(tolerance.rstrip("%")) / (100 if relative else 1)
+
+                services[option]["compression"] = (method, tolerance, relative, int(gap[0]) if gap else heartbeat)
+
+            except ValueError:
+                log("invalid_compression", argument=f"{option} = {value}")
+
+    def __motion(self, config, section, settings):
         #
         # except dates must be specified as comma separated intervals in the format
         # "%d.%m.%y %H:%M:%S - %d.%m.%y %H:%M:%S" (date_out_format) in the ini file
         # with %H, %M, or %S being optional parameters
         #
-
-        #
-        # Customized service descriptions
-        #
-        for service in HueServices:
-            value = config.get("Service Descriptions", service)
+        for option in config.options(section):
+            value = config.get(section, option)
             if value:
-                HueServices[service]["description"] = value
+                if option == "notify" or option == "suspend":
+                    settings[option] = config.getboolean(section, option)
+                elif option in ("coalesce", "burst", "digest"):
+                    settings[option] = config.getint(section, option)
+                elif option in ("rate", "total_rate"):
+                    settings[option] = config.getfloat(section, option)
+                elif option == "notify_to" and "@" in value:
+                    settings[option] = [ r.strip() for r in value.split(',') ]
+                else:
+                    settings[option] = value
 
-        #
-        # Customized settings for logging
-        #
-        for option in config.options("Logging"):
-            value = config.get("Logging", option)
-            if value:
-                LOGsettings[option] = value
+        return settings
 
-        #
-        # Customized settings for reporting
-        #
-        for option in config.options("Reporting"):
-            value = config.get("Reporting", option)
-            if value:
-                REPORTsettings[option] = value
+    def sensor(self, name):
+        # Settings of a sensor: its own section if any, else the [Motion Alert] settings
+        return self.sensors.get(name, self.motion)
 
-    except Exception as e:
-        log("cfg_read_error", argument=e)
+    def bridge(self, section):
+        return ([ settings for settings in self.bridges if settings["section"] == section ] or [ None ])[0]
+
+
+#
+# The current settings. Replaced as a whole when the config file changes
+#
+CONFIG = Config()
+
+
+def read_config():
+    global CONFIG
+
+    if not os.path.exists(config_file):
+        log("cfg_not_found", argument=config_file)
+        return None
 
-    return config
+    CONFIG = Config(config_file)
 
+    return CONFIG.parser
 
-def read_sensor_config(sensor_name):
-    #if not os.path.exists(config_file):
-    #    log("cfg_not_found", argument=config_file)
-    #    return None
 
-    #
-    # Set defaults
-    #
-    settings = MOTIONsettings
+def reload_config(*bridges):
+    # Swap in a new snapshot if the config file was modified. The event streams keep running
+    global CONFIG
 
     try:
-        config = ConfigParser()
-        config.read([os.path.abspath(config_file)])
+        if os.stat(config_file).st_mtime == CONFIG.mtime:
+            return False
+    except OSError:
+        return False
 
-        #
-        # Set notify on motion events to True if you want alert meesages on motion detection
-        # except dates specify periods when no alert is sent
-        #
-        if config.has_section(sensor_name):
-            #for option in ("notify", "suspend", "except", "except_daily"):
-            for option in config.options(sensor_name):
-                value = config.get(sensor_name, option)
-                if value:
-                    if option == "notify" or option == "suspend":
-                        settings[option] = config.getboolean(sensor_name, option)
-                    else:
-                        settings[option] = value
-        #
-        # except dates must be specified as comma separated intervals in the format
-        # "%d.%m.%y %H:%M:%S - %d.%m.%y %H:%M:%S" (date_out_format) in the ini file
-        # with %H, %M, or %S being optional parameters
-        #
-    except Exception as e:
-        log("cfg_read_error", argument=e)
+    snapshot = Config(config_file)
 
-    return settings
+    # Keep the current settings if the config file can't be read
+    if not snapshot.valid or not snapshot.bridges:
+        return False
+
+    previous, CONFIG = CONFIG, snapshot
+
+    # An ip address edited in the config file is used when the event stream reconnects
+    for bridge in bridges:
+        settings = CONFIG.bridge(bridge.section)
+        before   = previous.bridge(bridge.section)
+        if settings and before and settings["ip"] != before["ip"] and settings["ip"] != bridge.ip:
+            bridge.ip = settings["ip"]
+
+    log("cfg_reloaded", argument=config_file)
 
+    return True
 
-def save_config(config, key, value):
-    config.set("Hue Bridge", key, value)
+
+def save_config(config, key, value, section="Hue Bridge"):
+    config.set(section, key, value)
 
     try:
         with open(config_file, 'w') as configfile:
@@ -401,8 +765,8 @@ def save_config(config, key, value):
         log("cfg_write_error", argument=e)
 
 
-def save_key(config, key):
-    save_config(config, "key", key)
+def save_key(config, key, section="Hue Bridge"):
+    save_config(config, "key", key, section)
     #config.set("Hue Bridge", "key", key)
 
     #try:
@@ -412,8 +776,9 @@ def save_key(config, key):
     #    log("cfg_write_error", argument=e)
 
 
-def save_ip(config, ip):
-    save_config(config, "ip", ip)
+def save_ip(config, ip, section="Hue Bridge"):
+    # A discovered ip address is cached as "last_ip", the configured one is kept as a candidate
+    save_config(config, "last_ip", ip, section)
     #config.set("Hue Bridge", "ip", ip)
 
     #try:
@@ -424,59 +789,194 @@ def save_ip(config, ip):
 
 
 def log(message, argument=None):
-    if message in LOGsettings.keys():
-        if argument and "{}" in LOGsettings[message]:
-            print(LOGsettings[message].format(argument))
+    if message in CONFIG.log.keys():
+        if argument and "{}" in CONFIG.log[message]:
+            print(CONFIG.log[message].format(argument))
         else:
-            print(LOGsettings[message])
+            print(CONFIG.log[message])
     else:
         print(message)
 
 
+def local_timezone():
+    # Local time zone from $TZ or /etc/localtime, None if zoneinfo is not available
+    if not ZoneInfo:
+        return None
+
+    try:
+        if os.environ.get("TZ"):
+            return ZoneInfo(os.environ["TZ"].lstrip(":"))
+
+        with open("/etc/localtime", "rb") as f:
+            return ZoneInfo.from_file(f)
+
+    except Exception:
+        return None
+
+
+LOCAL_TZ = local_timezone()
+
+
+@functools.lru_cache(maxsize=1024)
+def utc_offset(period):
+    # Offset of local time to UTC for a quarter-hour period (epoch // 900).
+    # DST transitions are aligned to quarter-hours, so the offset is constant within a period
+    local = datetime.datetime.fromtimestamp(period * 900, LOCAL_TZ)
+
+    if LOCAL_TZ:
+        return local.utcoffset()
+    else:
+        return local.astimezone().utcoffset()
+
+
 def utc2local(utc):
-    epoch  = time.mktime(utc.timetuple())
-    offset = datetime.datetime.fromtimestamp(epoch) - datetime.datetime.utcfromtimestamp(epoch)
-    return utc + offset
+    # utc and the result are naive datetime objects
+    epoch = (utc - EPOCH).total_seconds()
+    return utc + utc_offset(int(epoch // 900))
 
 
-def check_date(date, range, daily=False):
-    if daily:
-        format = time_format
+def local2epoch(local):
+    # Naive local datetime to epoch seconds
+    if LOCAL_TZ:
+        return local.replace(tzinfo=LOCAL_TZ).timestamp()
     else:
-        format = date_out_format
+        return local.timestamp()
+
 
+def epoch2local(epoch):
+    # Epoch seconds to naive local datetime
+    return EPOCH + datetime.timedelta(seconds=epoch) + utc_offset(int(epoch // 900))
+
+
+def parse_utc(value):
+    # Parse an ISO 8601 timestamp as sent by the bridge, e.g. "2026-10-17T10:00:00.123Z", into a naive UTC datetime
     try:
-        interval = [ (x.strip(), y.strip()) for x, y in [ tuple(x.split("-")) for x in [ x.strip() for x in range.split(",") if x != "" ] ] ]
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        return datetime.datetime.strptime(value, date_in_format)
 
-        compare = datetime.datetime.strptime(date, format)
 
-        for first, last in interval:
-            start = datetime.datetime.strptime(first, format[:len(first)])
-            end = datetime.datetime.strptime(last, format[:len(last)])
+def parse_time(value):
+    # Bridge timestamp to naive local datetime
+    return utc2local(parse_utc(value))
 
-            if start <= compare <= end:
-                return True
-    except:
-        pass
 
-    return False
+def fixed_width_fields(format):
+    # Offset and width of the numeric fields of a fixed-width date format, None if the format has variable width
+    widths = { "d": 2, "m": 2, "y": 2, "Y": 4, "H": 2, "M": 2, "S": 2 }
+    fields = {}
+    pos = 0
+    i = 0
+
+    while i < len(format):
+        if format[i] == "%":
+            field = format[i + 1:i + 2]
+            if not field in widths:
+                return None
+
+            fields[field] = (pos, widths[field])
+            pos += widths[field]
+            i += 2
+        else:
+            pos += 1
+            i += 1
+
+    if not all(field in fields for field in "dmHMS") or not ("y" in fields or "Y" in fields):
+        return None
+
+    return fields, pos
+
 
+def parse_local_epochs(values):
+    # Vectorized parsing of strings starting with a date_out_format timestamp (local time) into epoch seconds
+    # (bulk loads from csv files). The UTC offset is looked up once per quarter-hour period present in the data
+    import numpy as np
 
-def html_report(bridge, datestr, imageid=None):
+    layout = fixed_width_fields(date_out_format)
+
+    if layout:
+        # Fixed-width format: compute the fields directly from the digits
+        fields, width = layout
+        digits = np.array([ value[:width] for value in values ], dtype=f"S{width}").view(np.uint8).reshape(-1, width).astype(np.int64) - 48
+
+        def field(name):
+            pos, size = fields[name]
+            return sum(digits[:, pos + k] * 10**(size - 1 - k) for k in range(size))
+
+        year = field("Y") if "Y" in fields else 2000 + field("y")
+        days = ((year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (field("m") - 1)).astype("datetime64[D]") + (field("d") - 1)
+        wall = days.astype(np.int64) * 86400 + field("H") * 3600 + field("M") * 60 + field("S")
+        wall = wall.astype(np.float64)
+
+    else:
+        # Any other format: let pandas parse the timestamps
+        import pandas as pd
+
+        spos = len(date_out_format.split())
+        dates = [ " ".join(value.split()[:spos]) for value in values ]
+        wall = ((pd.to_datetime(pd.Series(dates, dtype=object), format=date_out_format) - EPOCH) / pd.Timedelta(seconds=1)).to_numpy()
+
+    periods, inverse = np.unique(wall // 900, return_inverse=True)
+    offsets = np.array([ period * 900 - local2epoch(EPOCH + datetime.timedelta(seconds=period * 900)) for period in periods ])
+
+    return wall - offsets[inverse]
+
+
+def local_seconds(epochs):
+    # Vectorized conversion of epoch seconds to local wall-clock seconds (since 01.01.1970 00:00 local time).
+    # The UTC offset is looked up per day, per quarter-hour only on days with a DST transition
+    import numpy as np
+
+    epochs = np.asarray(epochs, dtype=np.float64)
+    if not len(epochs):
+        return epochs
+
+    days, inverse = np.unique(epochs // 86400, return_inverse=True)
+    first = np.array([ utc_offset(int(day) * 96).total_seconds() for day in days ])
+    last  = np.array([ utc_offset(int(day) * 96 + 95).total_seconds() for day in days ])
+
+    offsets = first[inverse]
+    changed = (first != last)[inverse]
+
+    if changed.any():
+        offsets[changed] = [ utc_offset(int(period)).total_seconds() for period in epochs[changed] // 900 ]
+
+    return epochs + offsets
+
+
+def motion_bins(epochs, first_day, days=1, width=15):
+    # Number of motion events per day and time slot of width minutes: array of shape (days, 1440 // width).
+    # Slots are computed from the local wall-clock seconds and counted in one go
+    import numpy as np
+
+    start = (datetime.datetime.combine(first_day, datetime.time()) - EPOCH).total_seconds()
+
+    wall = local_seconds(epochs) - start
+    wall = wall[(wall >= 0) & (wall < days * 86400)]
+
+    return np.bincount((wall // (width * 60)).astype(np.int64), minlength=days * (1440 // width)).reshape(days, 1440 // width)
+
+
+def motion_epochs(series):
+    # Times of the points with a true value (motion detected) of a time series
+    import numpy as np
+
+    return np.asarray(series.times)[np.asarray(series.values) != 0]
+
+
+def html_report(bridge, datestr, chart=None):
     try:
         html = \
 f"""
 <html>{HTMLheader}
   <body>
-    <h1>{REPORTsettings["report_header"].format(datestr)}</h1>
-    <p>{REPORTsettings['bridge_ip'].format(HUEsettings["ip"], get_ip_address('wlan0'))}</p>
+    <h1>{CONFIG.report["report_header"].format(datestr)}</h1>
+    <p>{CONFIG.report['bridge_ip'].format(bridge.ip, get_ip_address('wlan0'))}</p>
 """
 
-        if imageid:
-            html += \
-f"""
-    <p><img src="cid:{imageid[1:-1]}" alt="img" /></p>
-"""
+        if chart:
+            # The body is a format string for the sensor tables
+            html += chart.replace("{", "{{").replace("}", "}}")
 
         for sensor in bridge.sensors:
             for service in sensor.services:
@@ -484,15 +984,13 @@ f"""
                     power_service = service
                     break
 
-            power_service.update()
-
             html += \
 f"""
     <h2>{sensor.product_name}: {sensor.name}</h2>
-    <p>{REPORTsettings['notify_on_motion'].format(REPORTsettings['on'] if sensor.settings['notify'] else REPORTsettings['off'])}</p>
-    <p>{REPORTsettings['suspend_services'].format(REPORTsettings['on'] if sensor.settings['suspend'] else REPORTsettings['off'])}</p>
-    <p>{REPORTsettings['suppress_period'].format(sensor.settings['except'])}</p>
-    <p>{REPORTsettings['suppress_daily'].format(sensor.settings['except_daily'])}</p>
+    <p>{CONFIG.report['notify_on_motion'].format(CONFIG.report['on'] if sensor.settings['notify'] else CONFIG.report['off'])}</p>
+    <p>{CONFIG.report['suspend_services'].format(CONFIG.report['on'] if sensor.settings['suspend'] else CONFIG.report['off'])}</p>
+    <p>{CONFIG.report['suppress_period'].format(sensor.settings['except'])}</p>
+    <p>{CONFIG.report['suppress_daily'].format(sensor.settings['except_daily'])}</p>
     <p>{power_service.description}: {power_service.data[-1][1]} {power_service.unit}</p>
     {{}}
 """
@@ -510,7 +1008,7 @@ f"""
     return html
 
 
-def sendmail(recipients, subject, msg_body, subtype=None, attachments=None):
+def sendmail(recipients, subject, msg_body, subtype=None, attachments=None, timeout=NOTIFYTIMEOUT["smtp"]):
     #assert isinstance(recipients, list)
 
     if not recipients:
@@ -518,10 +1016,10 @@ def sendmail(recipients, subject, msg_body, subtype=None, attachments=None):
 
     msg = EmailMessage()
 
-    if SMTPsettings["name"]:
-        msg['From']  = formataddr((str(Header(SMTPsettings["name"], 'utf-8')), SMTPsettings["user"]))
+    if CONFIG.smtp["name"]:
+        msg['From']  = formataddr((str(Header(CONFIG.smtp["name"], 'utf-8')), CONFIG.smtp["user"]))
     else:
-        msg['From']  = SMTPsettings["user"]
+        msg['From']  = CONFIG.smtp["user"]
 
     msg['To']      = ", ".join(recipients)
     msg['Subject'] = subject
@@ -567,16 +1065,130 @@ def sendmail(recipients, subject, msg_body, subtype=None, attachments=None):
                     subtype=subtype
                 )
 
-    #context = ssl.create_default_context()
-    with smtplib.SMTP(SMTPsettings["server"], port=SMTPsettings["port"]) as server:
-        #server.starttls(context=context)
-        server.starttls()
-        server.login(SMTPsettings["user"], SMTPsettings["password"])
-        server.sendmail(SMTPsettings["user"], recipients, msg.as_string())
+    MAILER.send(recipients, msg.as_string(), timeout)
+
+
+class Mailer():
+    # One authenticated SMTP session for all mails of the process instead of a connect, STARTTLS and
+    # login per mail. The session is kept alive with NOOPs (keepalive() is called by the timer), closed
+    # after SMTPIDLE secs. without mail and reopened transparently if the server has dropped it
+
+    def __init__(self):
+        self.server   = None
+        self.account  = None
+        self.lock     = Lock()
+        self.last     = 0     # time of the last mail
+        self.noop     = 0     # time of the last command
+
+        atexit.register(self.close)
+
+    def send(self, recipients, message, timeout=NOTIFYTIMEOUT["smtp"]):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    server = self.__connect(timeout)
+                    server.sock.settimeout(timeout)
+                    server.sendmail(CONFIG.smtp["user"], recipients, message)
+                    self.last = self.noop = time.monotonic()
+                    return
+
+                except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                    # A dropped session is reopened once, a new session which fails is an error
+                    reused = self.server is not None and attempt == 0
+                    self.__close()
+                    if not reused:
+                        raise e
+
+                except smtplib.SMTPResponseException as e:
+                    # 421: the server is closing the session, other errors concern the mail only
+                    if e.smtp_code != 421:
+                        raise e
+                    self.__close()
+                    if attempt:
+                        raise e
+
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPNotSupportedError):
+                    raise
+
+                except:
+                    # Timeouts etc.: the state of the session is unknown
+                    self.__close()
+                    raise
+
+    def keepalive(self):
+        # Skipped if a mail is being sent
+        if not self.lock.acquire(blocking=False):
+            return
+
+        try:
+            if self.server is None:
+                return
+
+            now = time.monotonic()
+            if now - self.last >= SMTPIDLE or self.account != self.__account():
+                self.__close()
+            elif now - self.noop >= SMTPKEEPALIVE:
+                self.noop = now
+                if self.server.noop()[0] != 250:
+                    self.__close()
+
+        except (smtplib.SMTPException, OSError):
+            self.__close()
+
+        finally:
+            self.lock.release()
+
+    def close(self):
+        with self.lock:
+            self.__close()
+
+    def __account(self):
+        return (CONFIG.smtp["server"], CONFIG.smtp["port"], CONFIG.smtp["user"], CONFIG.smtp["password"], CONFIG.smtp["starttls"])
+
+    def __connect(self, timeout):
+        # Reuse the session unless the account settings have changed
+        if self.server is not None and self.account == self.__account():
+            return self.server
+
+        self.__close()
+
+        server = smtplib.SMTP(CONFIG.smtp["server"], port=CONFIG.smtp["port"], timeout=timeout)
+
+        try:
+            if CONFIG.smtp["starttls"]:
+                #context = ssl.create_default_context()
+                #server.starttls(context=context)
+                server.starttls()
+            server.login(CONFIG.smtp["user"], CONFIG.smtp["password"])
+
+        except:
+            server.close()
+            raise
+
+        self.server  = server
+        self.account = self.__account()
+        self.last    = self.noop = time.monotonic()
+
+        return server
+
+    def __close(self):
+        if self.server is None:
+            return
+
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+
+        self.server = None
+
+
+MAILER = Mailer()
 
 
 def service_profile(service_data, title, filename=None):
     # Create temperature profile in PNG format
+    plt, mdates = pyplot()
 
     if len(service_data) < 2:
         raise Exception("insufficient data")
@@ -640,10 +1252,12 @@ def service_profile(service_data, title, filename=None):
     return img_data
 
 
-def motion_profile(plotdata, filename=None):
+def motion_profile(plotdata, filename=None, title=None):
     # Create motion profile (all sensors) in PNG format
+    plt, mdates = pyplot()
 
     y_values = [1 if c == high_chr else 0 for c in plotdata]
+    width = 1440 // len(y_values) # minutes per bar
 
     plt.xlim(left=0, right=len(y_values)) # right = 95 + 1 to include 24:00
 
@@ -651,17 +1265,17 @@ def motion_profile(plotdata, filename=None):
     plt.figure().set_figheight(1.6)
     plt.bar(range(0, len(y_values)), y_values, width=1, align="edge")
 
-    # Print labels below x-axis, eevry 3 hrs (96/24 * 3 = 12), add one for 24:00
+    # Print labels below x-axis, every 3 hrs (e.g. 96/24 * 3 = 12), add one for 24:00
     today0 = datetime.datetime.strptime(today, day_format)
-    x_labels = [(today0 + datetime.timedelta(minutes=15*n)).strftime("%H:%M") for n in range(0, len(y_values) + 1)]
-    plt.xticks(range(0, len(x_labels), 12), x_labels[0::12], size=SMALL_SIZE)
+    x_labels = [(today0 + datetime.timedelta(minutes=width*n)).strftime("%H:%M") for n in range(0, len(y_values) + 1)]
+    plt.xticks(range(0, len(x_labels), 180 // width), x_labels[0::180 // width], size=SMALL_SIZE)
 
     # Use fixed limits on y-axis / autoscale off
     plt.ylim(bottom=0, top=1)
 
     # Print labels left beside y-axis
     #y_labels = ["0", "1"]
-    y_labels = [REPORTsettings["off"], REPORTsettings["on"]]
+    y_labels = [CONFIG.report["off"], CONFIG.report["on"]]
     plt.yticks(range(0, len(y_labels)), y_labels, size=SMALL_SIZE)
 
     # Use no margins
@@ -670,7 +1284,7 @@ def motion_profile(plotdata, filename=None):
 
     #plt.xlabel("Time", size=SMALL_SIZE)
     #plt.ylabel("Motion", size=SMALL_SIZE)
-    plt.title(REPORTsettings["motion_profile"], size=MEDIUM_SIZE, pad=20)
+    plt.title(title or CONFIG.report["motion_profile"], size=MEDIUM_SIZE, pad=20)
 
     ax = plt.gca()
 
@@ -679,7 +1293,7 @@ def motion_profile(plotdata, filename=None):
     ax.spines["right"].set_visible(False)
 
     # Set axis aspect ratio
-    ax.set_aspect(12.0)
+    ax.set_aspect(len(y_values) / 8)
 
     # Save as PNG file (or write to IOBuffer)
     if filename:
@@ -697,8 +1311,42 @@ def motion_profile(plotdata, filename=None):
     return img_data
 
 
+def motion_heatmap(grid, first_day, filename=None):
+    # Create heatmap of the motion events (days x time of day) in PNG format
+    plt, mdates = pyplot()
+
+    days, slots = grid.shape
+
+    # One row per day, height grows with the number of days
+    plt.figure().set_figheight(1.2 + min(days, 60) * .06)
+    plt.imshow(grid, aspect="auto", cmap="Blues", interpolation="nearest", extent=(0, 24, days, 0))
+
+    plt.xticks(range(0, 25, 3), [f"{hour:02d}:00" for hour in range(0, 25, 3)], size=SMALL_SIZE)
+
+    step = max(1, days // 10)
+    plt.yticks([ row + .5 for row in range(0, days, step) ], [ (first_day + datetime.timedelta(days=row)).strftime(day_format) for row in range(0, days, step) ], size=SMALL_SIZE)
+
+    plt.title(CONFIG.report["motion_heatmap"].format(days), size=MEDIUM_SIZE, pad=20)
+
+    # Save as PNG file (or write to IOBuffer)
+    if filename:
+        plt.savefig(filename, bbox_inches="tight")
+        img_data = None
+
+    else:
+        with io.BytesIO() as buf:  # use buffer memory
+            plt.savefig(buf, format='png', bbox_inches="tight")
+            buf.seek(0)
+            img_data = buf.getvalue()
+
+    plt.close()
+
+    return img_data
+
+
 def motion_profile_new(plotdata, filename=None):
     # Create motion profile (all sensors) in PNG format
+    plt, mdates = pyplot()
 
     today0 = datetime.datetime.strptime(today, day_format)
 
@@ -726,12 +1374,12 @@ def motion_profile_new(plotdata, filename=None):
 
     # Print labels left beside y-axis
     #y_labels = ["0", "1"]
-    y_labels = [REPORTsettings["off"], REPORTsettings["on"]]
+    y_labels = [CONFIG.report["off"], CONFIG.report["on"]]
     plt.yticks(range(0, len(y_labels)), y_labels, size=SMALL_SIZE)
 
     #plt.xlabel("Time", size=SMALL_SIZE)
     #plt.ylabel("Motion", size=SMALL_SIZE)
-    plt.title(REPORTsettings["motion_profile"], size=MEDIUM_SIZE, pad=20)
+    plt.title(CONFIG.report["motion_profile"], size=MEDIUM_SIZE, pad=20)
 
     ax = plt.gca()
 
@@ -763,215 +1411,1418 @@ def motion_profile_new(plotdata, filename=None):
     return img_data
 
 
-def sensor_data2df(sensor, update=False):
-    service_dict = {}
-    maxlen = 0
+class SVGChart():
+    # Built-in charts without dependencies: compact SVG markup inlined into the html report.
+    # Long series are reduced to first, min., max. and last value per pixel column
 
-    for service in sensor.services:
-        if service.name == "device_power":
-            continue
+    width  = 640
+    height = 170
+    left, right, top, bottom = 45, 15, 30, 25
 
-        if update and service.last_saved:
-            if service.unit:
-                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else REPORTsettings['on'] if value else REPORTsettings['off']} {service.unit}" for changed, value in service.data if changed > service.last_saved]
-            else:
-                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else REPORTsettings['on'] if value else REPORTsettings['off']}" for changed, value in service.data if changed > service.last_saved]
+    def __init__(self):
+        self.start = local2epoch(datetime.datetime.strptime(today, day_format))
 
-        else:
+    def x(self, epoch):
+        return self.left + (epoch - self.start) * (self.width - self.left - self.right) / 86400
+
+    def frame(self, title, body, y_labels, height=None):
+        # Title, hour grid every 3 hrs., y-axis labels given as (y, label) pairs
+        height = height or self.height
+        bottom = height - self.bottom
+        lines = [ f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width}" height="{height}" font-family="sans-serif" font-size="10">',
+                  f'<text x="{self.width // 2}" y="15" text-anchor="middle" font-size="12">{escape(title)}</text>' ]
+
+        for hour in range(0, 25, 3):
+            x = round(self.x(self.start + hour * 3600), 1)
+            lines.append(f'<line x1="{x}" y1="{self.top}" x2="{x}" y2="{bottom}" stroke="#ddd"/><text x="{x}" y="{bottom + 14}" text-anchor="middle">{hour:02d}:00</text>')
+
+        for y, label in y_labels:
+            lines.append(f'<text x="{self.left - 5}" y="{y + 3}" text-anchor="end">{escape(label)}</text>')
+
+        lines.append(body)
+        lines.append(f'<rect x="{self.left}" y="{self.top}" width="{self.width - self.left - self.right}" height="{bottom - self.top}" fill="none" stroke="#888"/></svg>')
+
+        return "\n".join(lines)
+
+    def profile(self, series, title, filename=None):
+        # Line chart of today's points of a time series
+        first = bisect.bisect_left(series.times, self.start)
+        last  = bisect.bisect_left(series.times, self.start + 86400)
+
+        if last - first < 2:
+            raise Exception("insufficient data")
+
+        times, values = series.times[first:last], series.values[first:last]
+
+        low, high = min(values), max(values)
+        if high == low:
+            low, high = low - .5, high + .5
+
+        scale = (self.height - self.top - self.bottom) / (high - low)
+        y = lambda value: round(self.height - self.bottom - (value - low) * scale, 1)
+
+        columns = {}
+        for epoch, value in zip(times, values):
+            column = columns.get(round(self.x(epoch)))
+            if column:
+                column[1] = min(column[1], value)
+                column[2] = max(column[2], value)
+                column[3] = value
+            else:
+                columns[round(self.x(epoch))] = [ value, value, value, value ]
+
+        points = []
+        for x, column in columns.items():
+            for value in dict.fromkeys(column):
+                points.append(f"{x},{y(value)}")
+
+        body = f'<polyline points="{" ".join(points)}" fill="none" stroke="#1f77b4"/>'
+        y_labels = [ (y(value), f"{value:g}") for value in (low, (low + high) / 2, high) ]
+
+        return f"\n    <p>{self.frame(title, body, y_labels)}</p>\n", None
+
+    def motion(self, counts, filename=None, title=None):
+        # Bar chart of the time slots with motion, adjacent slots are merged into one bar
+        width = (self.width - self.left - self.right) / len(counts)
+        bars = []
+
+        slot = 0
+        while slot < len(counts):
+            if counts[slot]:
+                end = slot
+                while end < len(counts) and counts[end]:
+                    end += 1
+                bars.append(f'<rect x="{round(self.left + slot * width, 1)}" y="{self.top}" width="{round((end - slot) * width, 1)}" height="{self.height - self.top - self.bottom}" fill="#1f77b4"/>')
+                slot = end
+            else:
+                slot += 1
+
+        y_labels = [ (self.height - self.bottom, CONFIG.report["off"]), (self.top, CONFIG.report["on"]) ]
+
+        return f"\n    <p>{self.frame(title or CONFIG.report['motion_profile'], ''.join(bars), y_labels)}</p>\n", None
+
+    def heatmap(self, grid, first_day, filename=None):
+        # Days x time slots, the opacity of a cell shows the number of events (5 levels, one path per level).
+        # Long periods are drawn with hourly slots and one row per week to keep the markup small
+        import numpy as np
+
+        days, slots = grid.shape
+
+        if days > 31 and slots > 24:
+            # Each slot is added to the hour it starts in, the slot width need not divide an hour
+            starts = np.arange(slots) * (1440 // slots)
+            grid   = np.add.reduceat(grid, np.searchsorted(starts, np.arange(24) * 60), axis=1)
+            slots  = 24
+
+        period = 7 if days > 62 else 1
+        if period > 1:
+            # Pad at the beginning: the last row ends with the last day
+            pad       = -days % period
+            grid      = np.vstack([ np.zeros((pad, slots), dtype=grid.dtype), grid ]).reshape(-1, period, slots).sum(axis=1)
+            first_day = first_day - datetime.timedelta(days=pad)
+
+        rows   = len(grid)
+        row    = max(2, min(12, 360 // rows))
+        height = self.top + rows * row + self.bottom
+        width  = round((self.width - self.left - self.right) / slots, 2)
+        levels = np.ceil(grid * 5 / (grid.max() or 1)).astype(int)
+
+        paths = []
+        for level in range(1, 6):
+            cells = "".join(f"M{round(self.left + slot * width, 1)} {self.top + index * row}h{width}v{row}h-{width}z" for index, slot in zip(*(levels == level).nonzero()))
+            if cells:
+                paths.append(f'<path d="{cells}" fill="#1f77b4" fill-opacity="{level / 5}"/>')
+
+        step = max(1, 12 // row)
+        y_labels = [ (self.top + index * row + row // 2, (first_day + datetime.timedelta(days=index * period)).strftime(day_format)) for index in range(0, rows, step) ]
+
+        return f"\n    <p>{self.frame(CONFIG.report['motion_heatmap'].format(days), ''.join(paths), y_labels, height)}</p>\n", None
+
+
+class PNGChart():
+    # High-fidelity charts via matplotlib: PNG images attached to the mail and referenced by their cid
+
+    def image(self, img_data, filename):
+        cid = make_msgid() #or f"<{os.path.basename(filename)}>"
+
+        attachment = {
+            "maintype": "image",
+            "subtype":  "png",
+            "cid":      cid,
+            "path":     filename,
+            "data":     img_data
+        }
+
+        return f'\n    <p><img src="cid:{cid[1:-1]}" alt="img" /></p>\n', attachment
+
+    def profile(self, series, title, filename):
+        return self.image(service_profile(series, title), filename)
+
+    def motion(self, counts, filename, title=None):
+        return self.image(motion_profile([ high_chr if count else low_chr for count in counts ], title=title), filename)
+
+    def heatmap(self, grid, first_day, filename):
+        return self.image(motion_heatmap(grid, first_day), filename)
+
+
+# Chart backends by name ("charts" option)
+CHARTS = {
+    "svg":        SVGChart,
+    "matplotlib": PNGChart
+}
+
+
+def charts():
+    # The configured chart backend. Falls back to the built-in charts if matplotlib is not installed
+    backend = CHARTS.get(CONFIG.data["charts"], SVGChart)
+
+    if backend is PNGChart:
+        try:
+            pyplot()
+        except ImportError:
+            backend = SVGChart
+
+    return backend()
+
+
+def motion_history(bridge, first_day, last_day):
+    # Motion event times of all sensors from first_day to last_day (excl.) from the database
+    start = local2epoch(datetime.datetime.combine(first_day, datetime.time()))
+    end   = local2epoch(datetime.datetime.combine(last_day, datetime.time()))
+
+    store = SQLiteStore(bridge.database)
+
+    try:
+        return [ store.times(service.id, start, end) for sensor in bridge.sensors for service in sensor.services if service.name == "motion" ]
+    finally:
+        store.close()
+
+
+def sensor_data2df(sensor, update=False):
+    import pandas as pd
+
+    service_dict = {}
+    maxlen = 0
+
+    for service in sensor.services:
+        if service.name == "device_power":
+            continue
+
+        if update and service.last_saved:
             if service.unit:
-                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else REPORTsettings['on'] if value else REPORTsettings['off']} {service.unit}" for changed, value in service.data]
+                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else CONFIG.report['on'] if value else CONFIG.report['off']} {service.unit}" for changed, value in service.data.since(service.last_saved)]
             else:
-                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else REPORTsettings['on'] if value else REPORTsettings['off']}" for changed, value in service.data]
+                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else CONFIG.report['on'] if value else CONFIG.report['off']}" for changed, value in service.data.since(service.last_saved)]
+
+        else:
+            if service.unit:
+                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else CONFIG.report['on'] if value else CONFIG.report['off']} {service.unit}" for changed, value in service.data]
+            else:
+                service_dict[service.description] = [f"{changed.strftime(date_out_format)} {value if not isinstance(value, bool) else CONFIG.report['on'] if value else CONFIG.report['off']}" for changed, value in service.data]
+
+        # Cleanup: use only items of today
+        service_dict[service.description] = [item for item in service_dict[service.description] if item.startswith(today)]
+
+        if len(service_dict[service.description]) > maxlen:
+             maxlen = len(service_dict[service.description])
+
+    service_dict[CONFIG.report["source"]] = [sensor.name for i in range(0, maxlen)]
+
+    # Specify dtype explicitly to avoid warning
+    #df = pd.DataFrame({key:pd.Series(value, dtype='float64') for key, value in service_dict.items()})
+    df = pd.DataFrame({key:pd.Series(value) for key, value in service_dict.items()})
+
+    return df
+
+
+def snapshot(bridge):
+    # Picklable copy of the data and settings needed for the report: no sessions, threads or database handles
+    return SimpleNamespace(
+        name      = bridge.name,
+        ip        = bridge.ip,
+        csv_store = bridge.csv_store,
+        database  = bridge.database.path if bridge.database else None,
+        sensors   = [ SimpleNamespace(
+            name         = sensor.name,
+            product_name = sensor.product_name,
+            settings     = dict(sensor.settings),
+            services     = [ SimpleNamespace(
+                id          = service.id,
+                name        = service.name,
+                description = service.description,
+                unit        = service.unit,
+                data        = service.data.copy(),
+                last_saved  = service.last_saved) for service in sensor.services ]) for sensor in bridge.sensors or [] ])
+
+
+def report(bridge, reset=False):
+    # The report is rendered and sent by a worker process from a snapshot of the data. pandas, matplotlib
+    # and smtp don't compete with the event streams, a crash or a timeout of the worker is only logged
+    stamps = [ time.perf_counter() ]
+
+    for sensor in bridge.sensors or []:
+        for service in sensor.services:
+            # Show current power status of all sensors
+            if service.name == "device_power":
+                service.update()
+                log(service.prompt())
+
+    # Store the points held back by the compressors, the series end at the last received points
+    for sensor in bridge.sensors or []:
+        for service in sensor.services:
+            service.flush()
+
+            if service.compressor:
+                log("compressed", argument=f"{sensor.name} {service.description} {service.compressor.stored}/{service.compressor.received}")
+
+    # The report process reads the history from the database
+    if bridge.database:
+        bridge.database.flush()
+
+    stamps.append(time.perf_counter())
+    data = snapshot(bridge)
+    stamps.append(time.perf_counter())
+
+    # Reset the data store of all services
+    if reset:
+        for sensor in bridge.sensors:
+            for service in sensor.services:
+                service.reset()
+
+    stamps.append(time.perf_counter())
+
+    if TIMERS.enabled:
+        TIMERS.lap(("report.refresh", "report.snapshot", "report.reset"), stamps)
+
+    # Monitor-only mode: no report
+    if CONFIG.data["monitor_only"]:
+        return True
+
+    # A fresh interpreter: no locks or threads of this process are inherited
+    worker = multiprocessing.get_context("spawn").Process(target=report_worker, args=(data, CONFIG.path, today), name=f"{bridge.name} report", daemon=True)
+
+    start = time.monotonic()
+
+    try:
+        worker.start()
+        worker.join(REPORTTIMEOUT)
+
+        if worker.is_alive():
+            worker.kill()
+            worker.join()
+            log("report_failed", argument="timeout")
+            return False
+
+    except Exception as e:
+        log("report_failed", argument=type(e).__name__)
+        return False
+
+    finally:
+        METRICS.observe("hue_report_seconds", time.monotonic() - start, bridge.labels)
+
+        if TIMERS.enabled:
+            TIMERS.lap(("report.worker",), (start, time.monotonic()))
+
+    if worker.exitcode:
+        log("report_failed", argument=f"exit code {worker.exitcode}")
+
+    return worker.exitcode == 0
+
+
+def report_worker(bridge, path, day):
+    # Entry point of the report process: same settings and reporting day as the monitor
+    global CONFIG, today
+
+    if path:
+        CONFIG = Config(path)
+    today = day
+
+    success = render_report(bridge)
+
+    try:
+        summarize(bridge)
+    except Exception as e:
+        log("exception", argument=type(e).__name__)
+
+    sys.exit(0 if success else 1)
+
+
+def render_report(bridge):
+    # Start with an empty list of attachments
+    attachments = []
+
+    # Set to False if the report could not be stored or sent
+    success = True
+
+    log(CONFIG.report["report_header"].format(today))
+
+    # Motion events of the passed day per sensor, counted in slots of bin_width minutes
+    day   = datetime.datetime.strptime(today, day_format).date()
+    width = CONFIG.data["bin_width"] if 0 < CONFIG.data["bin_width"] <= 1440 and 1440 % CONFIG.data["bin_width"] == 0 else 15
+
+    motion = { sensor.name: motion_epochs(service.data) for sensor in bridge.sensors or [] for service in sensor.services if service.name == "motion" }
+    counts = { name: motion_bins(epochs, day, width=width)[0] for name, epochs in motion.items() }
+
+    # Plot the motion profile (all sensors) on the 15 min. grid of the timeline
+    quarters = sum(motion_bins(epochs, day)[0] for epochs in motion.values()) if motion else [0] * 96
+    plot = [ high_chr if count else low_chr for count in quarters ]
+    log("".join(plot))
+    log(timeline)
+
+    chart = charts()
+
+    image, attachment = chart.motion(sum(counts.values()) if counts else [0] * (1440 // width), "motion.png")
+    if attachment:
+        attachments.append(attachment)
+
+    # Heatmap of the last days from the database (else from the data in memory)
+    if CONFIG.data["heatmap_days"] > 0:
+        try:
+            first_day = day - datetime.timedelta(days=CONFIG.data["heatmap_days"] - 1)
+            history = motion_history(bridge, first_day, day + datetime.timedelta(days=1)) if bridge.database else motion.values()
+
+            grids = [ motion_bins(epochs, first_day, CONFIG.data["heatmap_days"], max(width, 15)) for epochs in history ]
+
+            if grids:
+                heatmap, attachment = chart.heatmap(sum(grids), first_day, "heatmap.png")
+                image += heatmap
+                if attachment:
+                    attachments.append(attachment)
+
+        except Exception as e:
+            log(str(e))
+
+    # Send the daily report
+    log("report", argument=today)
+
+    html_body = html_report(bridge, today, chart=image)
+    html_tables = []
+
+    # Transform collected sensor data into DataFrame, CSV format
+    for sensor in bridge.sensors:
+        image = None
+
+        df = sensor_data2df(sensor)
+
+        columns = [column for column in list(df) if column != CONFIG.report["source"]]
+        html_table = df.to_html(index=False, header=True, na_rep='', border=0, columns=columns)
+
+        for service in sensor.services:
+            if service.name == "temperature":
+                try:
+                    image, attachment = chart.profile(service.data, f"{sensor.name}: {service.description} ({service.unit.strip()})", f"{sensor.name} {service.description}.png")
+
+                    if attachment:
+                        attachments.append(attachment)
+
+                except:
+                    image = None
+
+        if image:
+            html_table += image
+
+        # Motion profile of this sensor
+        if sensor.name in counts:
+            image, attachment = chart.motion(counts[sensor.name], f"{sensor.name} motion.png", CONFIG.report["sensor_motion"].format(sensor.name, int(sum(counts[sensor.name]))))
+            html_table += image
+
+            if attachment:
+                attachments.append(attachment)
+
+        html_tables.append(html_table)
+
+        # Attach sensor data or save as file?
+        if CONFIG.data["attach"] or bridge.csv_store:
+            attachment = {
+                "maintype": "text",
+                "subtype": "csv"
+            }
+
+            ts = datetime.datetime.strptime(today, day_format)
+            timestamp = ts.strftime("%y") + ts.strftime("%m") + ts.strftime("%d") # reverse today's date
+            file_path = f"{bridge.name}_{sensor.name}_{timestamp}.csv"
+
+            # Save sensor data locally? With an SQLite store, csv files are exported to a directory
+            if bridge.database and bridge.csv_store:
+                try:
+                    if not os.path.isdir(bridge.csv_store):
+                        os.makedirs(bridge.csv_store)
+
+                    file_path = os.path.join(bridge.csv_store, file_path)
+                    df.to_csv(file_path, sep='\t', index=False, header=True)
+
+                except Exception as e:
+                    log(str(e))
+                    success = False
+
+            elif bridge.csv_store:
+                try:
+                    # Is it the name of an existing file?
+                    if os.path.isfile(bridge.csv_store):
+                        file_path = bridge.csv_store
+                    # Is it the name of an existing directory?
+                    elif os.path.isdir(bridge.csv_store):
+                        file_path = os.path.join(bridge.csv_store, file_path)
+                    # Let's assume that a "." in the basename specifies the name of (not yet existing) file.
+                    elif "." in  os.path.basename(bridge.csv_store):
+                        file_path = bridge.csv_store
+                        # Create the parent directory if neccessary.
+                        if os.path.sep in bridge.csv_store and not os.path.isdir(bridge.csv_store.rsplit(os.path.sep, 1)[0]):
+                            os.makedirs(bridge.csv_store.rsplit(os.path.sep, 1)[0])
+                    # If it's neither a file nor an exisitng directory we'll create a directory with the specified name
+                    else:
+                        os.makedirs(bridge.csv_store)
+                        file_path = os.path.join(bridge.csv_store, file_path)
+
+                    if os.path.isfile(file_path):
+                        df = sensor_data2df(sensor, update=True)
+                        df.to_csv(file_path, mode='a', sep='\t', index=False, header=False)
+
+                    else:
+                        df.to_csv(file_path, sep='\t', index=False, header=True)
+
+                except Exception as e:
+                    log(str(e))
+                    success = False
+            else:
+                attachment["data"] = df.to_csv(sep='\t', index=False, header=True).encode("utf-8")
+
+            if CONFIG.data["attach"]:
+                attachment["path"] = file_path
+                attachments.append(attachment)
+
+    if html_body:
+        # Insert html_tables into html_body
+        html_body = html_body.format(*html_tables)
+
+        try:
+            sendmail(CONFIG.data["report_to"], CONFIG.report["report_subject"], html_body, subtype="html", attachments=attachments)
+            log("msg_sent")
+
+        except Exception as e:
+            log("msg_failed", argument=e)
+            success = False
+
+    else:
+        success = False
+
+    return success
+
+
+class Summary():
+    # Aggregates of one sensor and day: temperature min./max./sum/count per hour,
+    # number of motion events and battery level (lowest, last)
+
+    __slots__ = ("temperature", "motion", "battery")
+
+    services = ("temperature", "motion", "device_power")
+
+    def __init__(self, temperature=None, motion=0, battery=None):
+        self.temperature = temperature or {}
+        self.motion      = motion
+        self.battery     = battery
+
+    def add(self, service, hour, value):
+        if service == "temperature":
+            entry = self.temperature.get(hour)
+            if entry:
+                entry[0] = min(entry[0], value)
+                entry[1] = max(entry[1], value)
+                entry[2] += value
+                entry[3] += 1
+            else:
+                self.temperature[hour] = [ value, value, value, 1 ]
+
+        elif service == "motion":
+            if value:
+                self.motion += 1
+
+        elif service == "device_power":
+            self.battery = [ min(self.battery[0], value), value ] if self.battery else [ value, value ]
+
+    def merge(self, other):
+        # Add the aggregates of a later day
+        for hour, (low, high, total, count) in other.temperature.items():
+            entry = self.temperature.get(hour)
+            if entry:
+                self.temperature[hour] = [ min(entry[0], low), max(entry[1], high), entry[2] + total, entry[3] + count ]
+            else:
+                self.temperature[hour] = [ low, high, total, count ]
+
+        self.motion += other.motion
+
+        if other.battery:
+            self.battery = [ min(self.battery[0], other.battery[0]), other.battery[1] ] if self.battery else list(other.battery)
+
+    def to_dict(self):
+        return { "temperature": { str(hour): entry for hour, entry in self.temperature.items() }, "motion": self.motion, "battery": self.battery }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls({ int(hour): entry for hour, entry in data.get("temperature", {}).items() }, data.get("motion", 0), data.get("battery"))
+
+
+def summary_cache(bridge):
+    # File of the cached daily aggregates (json lines): the configured one, else next to the store
+    if CONFIG.data["summary_cache"]:
+        return CONFIG.data["summary_cache"]
+    elif bridge.database:
+        return os.path.splitext(bridge.database)[0] + ".summaries"
+    elif bridge.csv_store and os.path.isdir(bridge.csv_store):
+        return os.path.join(bridge.csv_store, "summaries.jsonl")
+    elif bridge.csv_store:
+        return bridge.csv_store + ".summaries"
+
+    return None
+
+
+def read_summaries(path, bridge, first_day, last_day):
+    # Cached aggregates of a bridge from first_day to last_day: (sensor, day) -> Summary. Read line by line
+    summaries = {}
+
+    if not path or not os.path.isfile(path):
+        return summaries
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            if entry.get("bridge") != bridge.name:
+                continue
+
+            day = datetime.date.fromisoformat(entry["day"])
+            if first_day <= day <= last_day:
+                summaries[(entry["sensor"], day)] = Summary.from_dict(entry)
+
+    return summaries
+
+
+def write_summaries(path, bridge, summaries):
+    if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    with open(path, "a", encoding="utf-8") as f:
+        for (sensor, day), summary in sorted(summaries.items(), key=lambda item: (item[0][1], item[0][0])):
+            f.write(json.dumps(dict(bridge=bridge.name, sensor=sensor, day=day.isoformat(), **summary.to_dict())) + "\n")
+
+
+def day_range(day):
+    # Epochs of the start of a day and the next day (local time)
+    start = datetime.datetime.combine(day, datetime.time())
+
+    return local2epoch(start), local2epoch(start + datetime.timedelta(days=1))
+
+
+def summarize_series(sensor, day):
+    # Aggregates of a day from the data in memory
+    summary = Summary()
+    start, end = day_range(day)
+
+    for service in sensor.services:
+        if service.name in Summary.services:
+            first = bisect.bisect_left(service.data.times, start)
+            last  = bisect.bisect_left(service.data.times, end)
+
+            for epoch, value in zip(service.data.times[first:last], service.data.values[first:last]):
+                summary.add(service.name, epoch2local(epoch).hour, service.data.type(value))
+
+    return summary
+
+
+def summarize_csv(path, summaries):
+    # Add the rows of a csv file to the aggregates of the wanted (sensor, day) keys. The file is read
+    # row by row, only the aggregates are kept in memory
+    services = { properties["description"]: name for name, properties in CONFIG.services.items() if name in Summary.services }
+    layout   = fixed_width_fields(date_out_format)
+    spos     = len(date_out_format.split())
+    days     = {}
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f, delimiter="\t")
+        header = next(reader, None)
+
+        if not header or not CONFIG.report["source"] in header:
+            return
+
+        source  = header.index(CONFIG.report["source"])
+        columns = [ (index, services[name]) for index, name in enumerate(header) if name in services ]
+
+        for row in reader:
+            for index, service in columns:
+                cell = row[index] if index < len(row) else ""
+                if not cell:
+                    continue
+
+                key = cell.split(" ", 1)[0]
+                if not key in days:
+                    days[key] = datetime.datetime.strptime(key, day_format).date()
+
+                summary = summaries.get((row[source], days[key]))
+                if summary is None:
+                    continue
+
+                if layout:
+                    position, width = layout[0]["H"]
+                    hour = int(cell[position:position + width])
+                else:
+                    hour = datetime.datetime.strptime(" ".join(cell.split()[:spos]), date_out_format).hour
+
+                value = cell.split(" ", spos + 1)[spos]
+                summary.add(service, hour, value == CONFIG.report["on"] if service == "motion" else float(value))
+
+
+def summarize_store(bridge, days):
+    # Aggregates of the given days from the store: the database is queried day by day, csv files are streamed
+    summaries = { (sensor.name, day): Summary() for sensor in bridge.sensors for day in days }
+
+    if bridge.database:
+        store = SQLiteStore(bridge.database)
+
+        try:
+            for day in days:
+                start, end = day_range(day)
+
+                for sensor in bridge.sensors:
+                    for service in sensor.services:
+                        if service.name in Summary.services:
+                            for epoch, value in store.query(service.id, start, end):
+                                summaries[(sensor.name, day)].add(service.name, epoch2local(epoch).hour, service.data.type(value))
+        finally:
+            store.close()
+
+    elif bridge.csv_store and os.path.isdir(bridge.csv_store):
+        for sensor in bridge.sensors:
+            for day in days:
+                path = os.path.join(bridge.csv_store, f"{bridge.name}_{sensor.name}_{day.strftime('%y%m%d')}.csv")
+                if os.path.isfile(path):
+                    summarize_csv(path, summaries)
+
+    elif bridge.csv_store and os.path.isfile(bridge.csv_store):
+        summarize_csv(bridge.csv_store, summaries)
+
+    return summaries
+
+
+def summary_report(bridge, subject, first_day, last_day):
+    # Weekly/monthly summary from the cached daily aggregates. Days which are not cached yet are
+    # aggregated from the store once and added to the cache
+    days = [ first_day + datetime.timedelta(days=n) for n in range((last_day - first_day).days + 1) ]
+    path = summary_cache(bridge)
+
+    summaries = read_summaries(path, bridge, first_day, last_day)
+    missing   = [ day for day in days if any(not (sensor.name, day) in summaries for sensor in bridge.sensors) ]
+
+    if missing:
+        computed = { key: summary for key, summary in summarize_store(bridge, missing).items() if not key in summaries }
+        summaries.update(computed)
+
+        if path:
+            write_summaries(path, bridge, computed)
+
+    sensors = [ sensor.name for sensor in bridge.sensors ]
+
+    # Temperature per hour of day over all days of the period
+    period = { name: Summary() for name in sensors }
+    for day in days:
+        for name in sensors:
+            period[name].merge(summaries[(name, day)])
+
+    def table(header, rows):
+        html  = "<table><tr>" + "".join(f"<th>{escape(str(cell))}</th>" for cell in header) + "</tr>"
+        html += "".join("<tr>" + "".join(f"<td>{escape(str(cell))}</td>" for cell in row) + "</tr>" for row in rows)
+        return html + "</table>"
+
+    def temperature(entry):
+        return f"{entry[0]:.1f} / {entry[2] / entry[3]:.1f} / {entry[1]:.1f}" if entry else ""
+
+    html = f"""
+<html>{HTMLheader.format()}
+  <body>
+    <h1>{escape(CONFIG.report["summary_header"].format(first_day.strftime(day_format), last_day.strftime(day_format)))}</h1>
+    <h2>{escape(CONFIG.report["summary_temp"])}</h2>
+    {table([ CONFIG.report["hour"] ] + sensors, [ [ f"{hour:02d}:00" ] + [ temperature(period[name].temperature.get(hour)) for name in sensors ] for hour in range(24) ])}
+    <h2>{escape(CONFIG.report["summary_motion"])}</h2>
+    {table([ CONFIG.report["day"] ] + sensors, [ [ day.strftime(day_format_long) ] + [ summaries[(name, day)].motion for name in sensors ] for day in days ])}
+    <h2>{escape(CONFIG.report["summary_battery"])}</h2>
+    {table([ CONFIG.report["day"] ] + sensors, [ [ day.strftime(day_format_long) ] + [ summaries[(name, day)].battery[1] if summaries[(name, day)].battery else "" for name in sensors ] for day in days ])}
+  </body>
+</html>
+"""
+
+    log(subject)
+    sendmail(CONFIG.data["report_to"], subject, html, subtype="html")
+    log("msg_sent")
+
+
+def summarize(bridge):
+    # Runs after the daily report (report process): caches the aggregates of the reported day and
+    # sends the weekly/monthly summaries after the last day of a week/month
+    day = datetime.datetime.strptime(today, day_format).date()
+
+    # The report at shutdown covers an incomplete day
+    if day >= datetime.date.today():
+        return
+
+    path = summary_cache(bridge)
+
+    if path and any(not (sensor.name, day) in read_summaries(path, bridge, day, day) for sensor in bridge.sensors):
+        write_summaries(path, bridge, { (sensor.name, day): summarize_series(sensor, day) for sensor in bridge.sensors })
+
+    if "weekly" in CONFIG.data["summaries"] and day.weekday() == 6:
+        first_day = day - datetime.timedelta(days=6)
+        summary_report(bridge, CONFIG.report["weekly_subject"].format(first_day.strftime(day_format), day.strftime(day_format)), first_day, day)
+
+    if "monthly" in CONFIG.data["summaries"] and (day + datetime.timedelta(days=1)).day == 1:
+        first_day = day.replace(day=1)
+        summary_report(bridge, CONFIG.report["monthly_subject"].format(first_day.strftime(day_format), day.strftime(day_format)), first_day, day)
+
+
+def deliver(target, subject, message):
+    # Send a notification to a ntfy url, a list of mail recipients or, without target, to the report recipients
+    if target and not isinstance(target, list):
+        headers = {
+            "Title": subject
+        }
+        #auth_string= f"{username}:{password}"
+        #headers["Authorization"] = "Basic " + base64.b64encode(auth_string.encode()).decode()
+        r = requests.post(target, data=message, headers=headers, timeout=NOTIFYTIMEOUT["ntfy"])
+        r.raise_for_status()
+    elif target:
+        sendmail(target, subject, message)
+    elif CONFIG.data["report_to"]:
+        sendmail(CONFIG.data["report_to"], subject, message)
+
+
+def notify_me(target, subject, message, logging=True):
+    # Queue the notification, it is delivered by the worker threads of the notifier
+    NOTIFIER.put(target, subject, message, logging)
+
+
+class Notifier():
+    # Notifications are delivered from a bounded queue by worker threads, the event streams never wait
+    # for a mail server. Failed deliveries are retried with exponential backoff. Notifications which
+    # don't fit into the queue, or can't be delivered at shutdown, are spilled to a file and queued
+    # again when there is room (or after a restart)
+
+    def __init__(self, size=NOTIFYQUEUE, workers=NOTIFYWORKERS):
+        self.queue     = queue.Queue(size)
+        self.workers   = workers
+        self.threads   = []
+        self.lock      = Lock()
+        self.stopped   = Event()
+        self.latencies = deque(maxlen=1000)
+        self.counts    = { "sent": 0, "failed": 0, "retries": 0, "spilled": 0 }
+
+    @property
+    def path(self):
+        if CONFIG.data["notify_spill"]:
+            return CONFIG.data["notify_spill"]
+        elif CONFIG.path:
+            return os.path.splitext(CONFIG.path)[0] + ".spill"
+
+        return None
+
+    def start(self):
+        # Started with the first notification: processes which never notify (e.g. the report) have no threads
+        with self.lock:
+            if self.threads or self.stopped.is_set():
+                return
+
+            self.threads = [ Thread(target=self.__worker, name=f"notify {i}", daemon=True) for i in range(self.workers) ]
+
+            for thread in self.threads:
+                thread.start()
+
+            # Deliver or spill the queued notifications on any exit of the monitor
+            atexit.register(self.close)
+
+    def put(self, target, subject, message, logging=True):
+        self.start()
+
+        item = [ time.time(), target, subject, message, logging ]
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.__spill([ item ])
+
+    def close(self, timeout=NOTIFYTIMEOUT["smtp"]):
+        # Each queued notification gets one more attempt, the rest is spilled
+        self.stopped.set()
+
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        self.__spill(items)
+
+    def metrics(self):
+        # Queue depth, delivery counts and latencies (secs. from queued to delivered) of the last deliveries
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return dict(self.counts, queued=self.queue.qsize(), p50=percentile(0.5), p95=percentile(0.95), max=percentile(1.0))
+
+    def status(self):
+        m = self.metrics()
+        return (f"{m['sent']} sent, {m['failed']} failed, {m['retries']} retries, {m['spilled']} spilled, {m['queued']} queued, "
+                f"latency p50/p95/max {m['p50']:.2f}/{m['p95']:.2f}/{m['max']:.2f} s")
+
+    def __worker(self):
+        while not self.stopped.is_set() or not self.queue.empty():
+            try:
+                item = self.queue.get(timeout=1)
+            except queue.Empty:
+                self.__unspill()
+                continue
+
+            try:
+                self.__deliver(self.__batch(item))
+            finally:
+                self.queue.task_done()
+
+    def __batch(self, item):
+        # Mails to the same recipients and with the same subject which are queued meanwhile are sent as one mail,
+        # ntfy messages are sent one by one
+        target = item[1]
+        if target and not isinstance(target, list):
+            return [ item ]
+
+        batch, others = [ item ], []
+        while True:
+            try:
+                other = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            self.queue.task_done()
+            (batch if other[1:3] == item[1:3] else others).append(other)
+
+        for index, other in enumerate(others):
+            try:
+                self.queue.put_nowait(other)
+            except queue.Full:
+                self.__spill(others[index:])
+                break
+
+        return batch
+
+    def __deliver(self, items):
+        created, target, subject, message, logging = items[0]
+        message = "\n".join(item[3] for item in items)
+        logging = any(item[4] for item in items)
+        wait = NOTIFYBACKOFF
+
+        for attempt in range(NOTIFYRETRIES):
+            try:
+                deliver(target, subject, message)
+
+                with self.lock:
+                    self.counts["sent"] += len(items)
+                    self.latencies.extend(time.time() - item[0] for item in items)
+
+                if logging:
+                    log("msg_sent")
+                return
+
+            except Exception as e:
+                error = e
+
+            # No retries at shutdown, the notifications are spilled instead
+            if self.stopped.is_set():
+                self.__spill(items)
+                return
+
+            if attempt + 1 < NOTIFYRETRIES:
+                with self.lock:
+                    self.counts["retries"] += 1
+
+                if self.stopped.wait(wait):
+                    self.__spill(items)
+                    return
+
+                wait = min(wait * 2, NOTIFYMAXWAIT)
+
+        with self.lock:
+            self.counts["failed"] += len(items)
+
+        if logging:
+            log("msg_failed", argument=error)
+
+    def __spill(self, items):
+        path = self.path
+        if not items or not path:
+            return
+
+        with self.lock:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    for item in items:
+                        f.write(json.dumps(item) + "\n")
+                self.counts["spilled"] += len(items)
+
+            except OSError as e:
+                log("msg_failed", argument=e)
+
+    def __unspill(self):
+        # Queue spilled notifications again as long as there is room, keep the rest in the file
+        path = self.path
+        if not path or not os.path.isfile(path) or self.stopped.is_set():
+            return
+
+        with self.lock:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    items = [ json.loads(line) for line in f if line.strip() ]
+
+                while items:
+                    self.queue.put_nowait(items[0])
+                    items.pop(0)
+
+            except queue.Full:
+                pass
+
+            except (OSError, ValueError) as e:
+                log("msg_failed", argument=e)
+                return
+
+            try:
+                if items:
+                    with open(path + ".tmp", "w", encoding="utf-8") as f:
+                        f.writelines(json.dumps(item) + "\n" for item in items)
+                    os.replace(path + ".tmp", path)
+                else:
+                    os.remove(path)
+
+            except OSError as e:
+                log("msg_failed", argument=e)
+
+
+NOTIFIER = Notifier()
+
+
+class TokenBucket():
+    # rate tokens per hour, at most burst tokens
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst):
+        self.rate   = rate / 3600
+        self.burst  = max(1, burst)
+        self.tokens = self.burst
+        self.stamp  = time.monotonic()
+
+    def wait(self, now):
+        # Secs. until a token is available
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp  = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        if self.wait(now):
+            return False
+
+        self.tokens -= 1
+        return True
+
+
+class MotionAlerts():
+    # Motion alerts pass a token bucket per sensor (rate, burst) and one for all sensors (total_rate).
+    # Events within the coalescing window or the digest interval are sent as one alert listing the
+    # sensors and times. Events held back by the rate limits are sent with a later alert, none is dropped
+
+    def __init__(self):
+        self.lock    = Lock()
+        self.wakeup  = Event()
+        self.thread  = None
+        self.pending = {}     # (target, subject): [ due, target, subject, [ (sensor name, changed), ... ] ]
+        self.buckets = {}     # sensor name (None: all sensors): TokenBucket
+        self.counts  = { "events": 0, "alerts": 0 }
+
+    def add(self, sensor, changed):
+        settings = sensor.settings
+        window   = CONFIG.motion["digest"] * 60 or settings["coalesce"]
+
+        with self.lock:
+            self.counts["events"] += 1
+
+            # Neither coalescing nor rate limits: an alert per event
+            if not window and not settings["rate"] and not CONFIG.motion["total_rate"]:
+                self.counts["alerts"] += 1
+                notify_me(settings["notify_to"], settings["notify_subject"], self.text(sensor.name, changed))
+                return
+
+            # Sensors with a shorter coalescing window send the pending alert earlier
+            key   = (json.dumps(settings["notify_to"]), settings["notify_subject"])
+            alert = self.pending.setdefault(key, [ time.monotonic() + window, settings["notify_to"], settings["notify_subject"], [] ])
+            alert[0] = min(alert[0], time.monotonic() + window)
+            alert[3].append((sensor.name, changed))
+
+            if not self.thread:
+                self.thread = Thread(target=self.__run, name="motion alerts", daemon=True)
+                self.thread.start()
+
+                # Pending events are sent on any exit of the monitor, regardless of the rate limits
+                atexit.register(self.flush, True)
+
+        self.wakeup.set()
+
+    def status(self):
+        with self.lock:
+            return f"{self.counts['events']}/{self.counts['alerts']}/{sum(len(alert[3]) for alert in self.pending.values())}"
+
+    def flush(self, force=False):
+        # Send the alerts which are due, returns the secs. until the next alert is due (None: no pending alert)
+        now = time.monotonic()
+
+        with self.lock:
+            total = self.__bucket(None, CONFIG.motion["total_rate"], CONFIG.motion["burst"])
+
+            for key, alert in list(self.pending.items()):
+                due, target, subject, events = alert
+                if due > now and not force:
+                    continue
+
+                wait = total.wait(now) if total and not force else 0
+                if wait:
+                    alert[0] = now + wait
+                    continue
+
+                # One token per sensor and alert, events of sensors without token are held back
+                sent, held, waits = [], [], []
+                for name, changed in sorted(events, key=lambda event: event[1]):
+                    settings = CONFIG.sensor(name)
+                    bucket   = self.__bucket(name, settings["rate"], settings["burst"])
+
+                    if force or not bucket or any(name == other for other, _ in sent) or bucket.take(now):
+                        sent.append((name, changed))
+                    else:
+                        held.append((name, changed))
+                        waits.append(bucket.wait(now))
 
-        # Cleanup: use only items of today
-        service_dict[service.description] = [item for item in service_dict[service.description] if item.startswith(today)]
+                if sent:
+                    if total and not force:
+                        total.take(now)
 
-        if len(service_dict[service.description]) > maxlen:
-             maxlen = len(service_dict[service.description])
+                    self.counts["alerts"] += 1
+                    notify_me(target, subject, "\n".join(self.text(name, changed) for name, changed in sent))
 
-    service_dict[REPORTsettings["source"]] = [sensor.name for i in range(0, maxlen)]
+                if held:
+                    alert[0] = now + min(waits)
+                    alert[3] = held
+                else:
+                    del self.pending[key]
 
-    # Specify dtype explicitly to avoid warning
-    #df = pd.DataFrame({key:pd.Series(value, dtype='float64') for key, value in service_dict.items()})
-    df = pd.DataFrame({key:pd.Series(value) for key, value in service_dict.items()})
+            return max(0, min(alert[0] for alert in self.pending.values()) - now) if self.pending else None
 
-    return df
+    @staticmethod
+    def text(name, changed):
+        # An invalid notify_text of the sensor must not block its alerts, the default text is used instead
+        try:
+            return CONFIG.sensor(name)["notify_text"].format(name, changed.strftime(time_format))
+        except (KeyError, IndexError, ValueError):
+            return MOTIONsettings["notify_text"].format(name, changed.strftime(time_format))
 
+    def __bucket(self, name, rate, burst):
+        # Buckets follow changes of the settings
+        if not rate:
+            self.buckets.pop(name, None)
+            return None
 
-def report(bridge, reset=False):
-    # Start with an empty list of attachments
-    attachments = []
+        bucket = self.buckets.get(name)
+        if not bucket or bucket.rate != rate / 3600 or bucket.burst != max(1, burst):
+            bucket = self.buckets[name] = TokenBucket(rate, burst)
 
-    log(REPORTsettings["report_header"].format(today))
+        return bucket
 
-    plot = list(96*low_chr)
-    #plot = [high_chr if x else low_chr for x in lista] when lista = [False, True, True, False, False, ...]
+    def __run(self):
+        # An error must not end the thread, the pending alerts are sent again after ALERTRETRY secs.
+        while True:
+            try:
+                wait = self.flush()
+            except Exception as e:
+                log("exception", argument=type(e).__name__)
+                wait = ALERTRETRY
 
-    for sensor in bridge.sensors or []:
-        for service in sensor.services:
-            # Show current power status of all sensors
-            if service.name == "device_power":
-                service.update()
-                log(service.prompt())
+            self.wakeup.wait(wait)
+            self.wakeup.clear()
 
-            # Get the motion profile of the passed day (all sensors)
-            if service.name == "motion":
-                for changed, value in service.data:
-                    if value and changed.strftime(day_format) == today:
-                        h = int(changed.strftime("%H"))
-                        m = int(changed.strftime("%M"))
-                        plot_index = h*4 + m//15   # plot_index = h*n//24 + m//(60//(n//24)), n = 96, 288, 720 (for 15min, 5min, 1min interval)
-                        plot[plot_index] = high_chr
-
-    # Plot the motion profile
-    log("".join(plot))
-    log(timeline)
 
-    filename = "motion.png"
-    cid = make_msgid() #or f"<{os.path.basename(filename)}>"
+ALERTS = MotionAlerts()
 
-    #img_data = motion_profile(plot, filename) # returns None if filename != None
-    img_data = motion_profile(plot)
 
-    attachment = {
-        "maintype": "image",
-        "subtype":  "png",
-        "cid":      cid,
-        "path":     filename,
-        "data":     img_data
-    }
-    attachments.append(attachment)
+#
+# Metrics: name -> (type, help, histogram buckets in secs.)
+#
+DURATIONS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICSinfo = {
+    "hue_events_received_total":      ("counter",   "Updates received from the event stream", None),
+    "hue_events_dispatched_total":    ("counter",   "Updates dispatched to a service", None),
+    "hue_events_dropped_total":       ("counter",   "Updates of unknown services or with invalid data", None),
+    "hue_json_decode_seconds":        ("histogram", "Time to decode an event stream frame", DURATIONS),
+    "hue_dispatch_seconds":           ("histogram", "Time to dispatch an update (on_change, update, log)", DURATIONS),
+    "hue_stream_connects_total":      ("counter",   "Event stream connections", None),
+    "hue_stream_errors_total":        ("counter",   "Event stream connection errors", None),
+    "hue_stream_retries_left":        ("gauge",     "Attempts left before the event stream gives up", None),
+    "hue_rest_seconds":               ("histogram", "Latency of REST calls to the bridge", DURATIONS),
+    "hue_notifications_queued":       ("gauge",     "Notifications waiting for delivery", None),
+    "hue_notifications_total":        ("counter",   "Notifications by result", None),
+    "hue_notification_latency_seconds": ("summary", "Latency from queued to delivered (recent deliveries)", None),
+    "hue_report_seconds":             ("histogram", "Duration of the report process", (1, 5, 10, 30, 60, 120, 300, 600)),
+    "hue_service_points":             ("gauge",     "Data points held in memory per service", None),
+    "hue_process_resident_bytes":     ("gauge",     "Resident memory of the monitor process", None)
+}
 
-    # Send the daily report
-    log("report", argument=today)
 
-    html_body = html_report(bridge, today, imageid=cid)
-    html_tables = []
+class Metrics():
+    # Counters, gauges and histograms in the Prometheus text format. Updates on the event path are
+    # dict and list increments, the text is rendered on request. Collectors add the values which
+    # are read from other objects (queue, services, process) at that time. The stream threads of
+    # several bridges update the same metrics, the lock keeps the increments from getting lost
 
-    # Transform collected sensor data into DataFrame, CSV format
-    for sensor in bridge.sensors:
-        cid = None
+    def __init__(self):
+        self.values     = {}     # (name, labels): value
+        self.histograms = {}     # (name, labels): [ counts per bucket + overflow, sum ]
+        self.collectors = []
+        self.lock       = threading.Lock()
 
-        df = sensor_data2df(sensor)
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
 
-        columns = [column for column in list(df) if column != REPORTsettings["source"]]
-        html_table = df.to_html(index=False, header=True, na_rep='', border=0, columns=columns)
+    def set(self, name, value, labels=()):
+        with self.lock:
+            self.values[(name, labels)] = value
 
-        for service in sensor.services:
-            if service.name == "temperature":
-                try:
-                    filename = f"{sensor.name} {service.description}.png"
-                    cid = make_msgid() #or f"<{os.path.basename(filename)}>"
-
-                    #img_data = service_profile(service.data, f"{sensor.name}: {service.description} ({service.unit.strip()})", filename)
-                    img_data = service_profile(service.data, f"{sensor.name}: {service.description} ({service.unit.strip()})")
-
-                    attachment = {
-                        "maintype": "image",
-                        "subtype":  "png",
-                        "cid":      cid,
-                        "path":     filename,
-                        "data":     img_data
-                    }
-                    attachments.append(attachment)
+    def observe(self, name, value, labels=()):
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = [ [0] * (len(METRICSinfo[name][2]) + 1), 0.0 ]
 
-                except:
-                    cid = None
+            histogram[0][bisect.bisect_left(METRICSinfo[name][2], value)] += 1
+            histogram[1] += value
 
-        if cid:
-            html_table += \
-f"""
-    <p><img src="cid:{cid[1:-1]}" alt="img" /></p>
-"""
+    def collect(self, collector):
+        # collector() returns [ (name, labels, value), ... ]
+        self.collectors.append(collector)
 
-        html_tables.append(html_table)
+    def render(self):
+        samples = {}
 
-        # Attach sensor data or save as file?
-        if DATAsettings["attach"] or DATAsettings["store"]:
-            attachment = {
-                "maintype": "text",
-                "subtype": "csv"
-            }
+        with self.lock:
+            values     = list(self.values.items())
+            histograms = [ (key, (list(counts), total)) for key, (counts, total) in self.histograms.items() ]
 
-            ts = datetime.datetime.strptime(today, day_format)
-            timestamp = ts.strftime("%y") + ts.strftime("%m") + ts.strftime("%d") # reverse today's date
-            file_path = f"{bridge.name}_{sensor.name}_{timestamp}.csv"
+        for (name, labels), value in values:
+            samples.setdefault(name, []).append((name, labels, value))
 
-            # Save sensor data locally?
-            if DATAsettings["store"]:
-                try:
-                    # Is it the name of an existing file?
-                    if os.path.isfile(DATAsettings["store"]):
-                        file_path = DATAsettings["store"]
-                    # Is it the name of an existing directory?
-                    elif os.path.isdir(DATAsettings["store"]):
-                        file_path = os.path.join(DATAsettings["store"], file_path)
-                    # Let's assume that a "." in the basename specifies the name of (not yet existing) file.
-                    elif "." in  os.path.basename(DATAsettings["store"]):
-                        file_path = DATAsettings["store"]
-                        # Create the parent directory if neccessary.
-                        if os.path.sep in DATAsettings["store"] and not os.path.isdir(DATAsettings["store"].rsplit(os.path.sep, 1)[0]):
-                            os.makedirs(DATAsettings["store"].rsplit(os.path.sep, 1)[0])
-                    # If it's neither a file nor an exisitng directory we'll create a directory with the specified name
-                    else:
-                        os.makedirs(DATAsettings["store"])
-                        file_path = os.path.join(DATAsettings["store"], file_path)
+        for collector in self.collectors:
+            try:
+                for name, labels, value in collector():
+                    samples.setdefault(name, []).append((name, labels, value))
+            except Exception as e:
+                log("exception", argument=type(e).__name__)
 
-                    if os.path.isfile(file_path):
-                        df = sensor_data2df(sensor, update=True)
-                        df.to_csv(file_path, mode='a', sep='\t', index=False, header=False)
+        for (name, labels), (counts, total) in histograms:
+            cumulative = 0
+            for bound, count in zip(METRICSinfo[name][2] + ("+Inf",), counts):
+                cumulative += count
+                samples.setdefault(name, []).append((name + "_bucket", labels + (("le", str(bound)),), cumulative))
+
+            samples[name].append((name + "_sum", labels, total))
+            samples[name].append((name + "_count", labels, cumulative))
+
+        lines = []
+        for name in sorted(samples):
+            kind, text, buckets = METRICSinfo[name]
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+            for sample, labels, value in samples[name]:
+                if labels:
+                    labels = ",".join(f'{label}="{self.escape(entry)}"' for label, entry in labels)
+                    lines.append(f"{sample}{{{labels}}} {value}")
+                else:
+                    lines.append(f"{sample} {value}")
 
-                    else:
-                        df.to_csv(file_path, sep='\t', index=False, header=True)
+        return "\n".join(lines) + "\n"
 
-                except Exception as e:
-                    log(str(e))
-            else:
-                attachment["data"] = df.to_csv(sep='\t', index=False, header=True).encode("utf-8")
+    @staticmethod
+    def escape(text):
+        return str(text).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
 
-            if DATAsettings["attach"]:
-                attachment["path"] = file_path
-                attachments.append(attachment)
 
-    if html_body:
-        # Insert html_tables into html_body
-        html_body = html_body.format(*html_tables)
+METRICS = Metrics()
 
-        try:
-            sendmail(DATAsettings["report_to"], REPORTsettings["report_subject"], html_body, subtype="html", attachments=attachments)
-            log("msg_sent")
 
-        except Exception as e:
-            log("msg_failed", argument=e)
+class StageTimers():
+    # Rolling window of the last durations per stage (e.g. "events.json"), percentiles on demand
 
-    # Reset the data store of all services
-    if reset:
-        for sensor in bridge.sensors:
-            for service in sensor.services:
-                service.reset()
+    def __init__(self, window=STAGEWINDOW):
+        self.window = window
+        self.stages = {}
 
+    @property
+    def enabled(self):
+        return CONFIG.data["stage_timers"]
+
+    def lap(self, names, stamps):
+        # Durations between consecutive perf_counter() stamps, one stamp more than names
+        for name, start, end in zip(names, stamps, stamps[1:]):
+            durations = self.stages.get(name)
+            if durations is None:
+                durations = self.stages[name] = deque(maxlen=self.window)
+
+            durations.append(end - start)
+
+    def report(self):
+        lines = [ f"{'stage':20} {'count':>8} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'max ms':>10} {'total s':>10}" ]
+
+        for name, durations in sorted(self.stages.items()):
+            durations = sorted(durations)
+            if not durations:
+                continue
+
+            def percentile(p):
+                return durations[min(len(durations) - 1, int(p * len(durations)))] * 1000
+
+            lines.append(f"{name:20} {len(durations):>8} {percentile(0.5):>10.3f} {percentile(0.9):>10.3f} {percentile(0.99):>10.3f} {durations[-1] * 1000:>10.3f} {sum(durations):>10.3f}")
+
+        return lines
+
+
+TIMERS = StageTimers()
+
+
+def sample_profile(seconds=PROFILESECS, interval=PROFILEINTERVAL):
+    # Sampling profile of all threads (except this one): the stacks are read every interval secs.
+    # The monitor is neither stopped nor traced. Returns the lines of the dump
+    me      = threading.get_ident()
+    names   = { thread.ident: thread.name for thread in threading.enumerate() }
+    stacks  = {}
+    own     = {}
+    total   = {}
+    samples = 0
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                frame = frame.f_back
+
+            if not stack:
+                continue
+
+            key = ";".join([ names.get(ident, str(ident)) ] + stack[::-1])
+            stacks[key] = stacks.get(key, 0) + 1
+            own[stack[0]] = own.get(stack[0], 0) + 1
+            for function in set(stack):
+                total[function] = total.get(function, 0) + 1
+
+        samples += 1
+        time.sleep(interval)
+
+    lines = [ f"Sampling profile: {samples} samples in {seconds} secs. (every {interval * 1000:.0f} ms)", "", "Functions by own samples:" ]
+    lines += [ f"{count:>8} {function}" for function, count in sorted(own.items(), key=lambda item: -item[1])[:30] ]
+    lines += [ "", "Functions by total samples (incl. callees):" ]
+    lines += [ f"{count:>8} {function}" for function, count in sorted(total.items(), key=lambda item: -item[1])[:30] ]
+    lines += [ "", "Stacks (thread;outermost;...;innermost count, e.g. for flamegraph.pl):" ]
+    lines += [ f"{stack} {count}" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]) ]
+
+    return lines
+
+
+def dump_profile():
+    # Stage timers and a sampling profile to <profile dir>/hue_monitor-<date time>.profile
+    folder = CONFIG.data["profile"] or (os.path.dirname(os.path.abspath(CONFIG.path)) if CONFIG.path else os.getcwd())
+    path = os.path.join(folder, f"{os.path.splitext(config_file)[0]}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.profile")
+
+    lines = [ f"Stage timers (last {STAGEWINDOW} per stage):" ]
+    lines += TIMERS.report() if TIMERS.stages else [ "none - set stage_timers = yes" ]
+    lines += [ "" ] + sample_profile()
 
-def notify_me(target, subject, message, logging=True):
     try:
-        if target and not isinstance(target, list):
-            headers = {
-                "Title": subject
-            }
-            #auth_string= f"{username}:{password}"
-            #headers["Authorization"] = "Basic " + base64.b64encode(auth_string.encode()).decode()
-            r = requests.post(target, data=message, headers=headers)
-            r.raise_for_status()
-        elif target:
-            sendmail(target, subject, message)
-        elif DATAsettings["report_to"]:
-            sendmail(DATAsettings["report_to"], subject, message)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        log("profile", argument=path)
+    except OSError as e:
+        log("exception", argument=e)
 
-        if logging:
-            log("msg_sent")
 
-    except Exception as e:
-        if logging:
-            log("msg_failed", argument=e)
+def process_rss():
+    # Resident memory in bytes, the peak value if /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def serve_metrics(address, bridges):
+    # Prometheus endpoint: http://[address:]port/metrics, all interfaces if only the port is specified
+    host, _, port = str(address).rpartition(":")
+
+    def services():
+        return [ ("hue_service_points", service.labels, len(service.data)) for bridge in bridges for sensor in bridge.sensors for service in sensor.services ]
+
+    def notifications():
+        m = NOTIFIER.metrics()
+        return [ ("hue_notifications_queued", (), m["queued"]) ] + \
+               [ ("hue_notifications_total", (("result", result),), m[result]) for result in ("sent", "failed", "retries", "spilled") ] + \
+               [ ("hue_notification_latency_seconds", (("quantile", quantile),), m[key]) for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("1", "max")) ]
+
+    METRICS.collect(services)
+    METRICS.collect(notifications)
+    METRICS.collect(lambda: [ ("hue_process_resident_bytes", (), process_rss()) ])
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = METRICS.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    try:
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+    except (OSError, ValueError) as e:
+        log("exception", argument=e)
+        return None
+
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    log("metrics", argument=f"{host or socket.gethostname()}:{port}")
+
+    return server
 
 
 def on_change(bridge, sensor, service, changed, value):
@@ -979,24 +2830,50 @@ def on_change(bridge, sensor, service, changed, value):
         log("motion_detected", argument=sensor.name)
         if sensor.settings["notify"]:
             # Send alert message if no exceptions apply
-            if not check_date(changed.strftime(date_out_format), sensor.settings["except"]) and not check_date(changed.strftime(time_format), sensor.settings["except_daily"], daily=True):
-                msg_text = sensor.settings["notify_text"].format(sensor.name, changed.strftime(time_format))
-                notify_me(sensor.settings["notify_to"], sensor.settings["notify_subject"], msg_text)
+            if not changed in sensor.settings["schedule"]:
+                ALERTS.add(sensor, changed)
             else:
                 log("msg_restricted")
 
 
 class Bridge():
 
-    def __init__(self, ip_address, username=None, onchange=None):
+    def __init__(self, ip_address, username=None, onchange=None, asynchronous=False, store=None, section="Hue Bridge"):
         self.ip            = ip_address
         self.onchange      = onchange
 
+        # The config section of this bridge
+        self.section       = section
+        self.labels        = (("bridge", section),)
+
+        # Per bridge data store, defaults to the global one. Either csv file(s) or an SQLite database
+        self.store         = store or CONFIG.data["store"]
+
+        self.journal       = Journal.open(CONFIG.data["journal"], batch=CONFIG.data["journal_batch"], interval=CONFIG.data["journal_sync"]) if CONFIG.data["journal"] else None
+
+        if is_database(self.store):
+            self.database  = SQLiteStore(self.store, batch=CONFIG.data["batch"], interval=CONFIG.data["flush"])
+            self.csv_store = CONFIG.data["export"]
+        else:
+            self.database  = None
+            self.csv_store = self.store
+
+        # The asyncio client needs aiohttp (sudo pip3 install aiohttp)
+        self.asynchronous  = asynchronous and aiohttp_client() is not None
+        self.async_session = None
+
+        # Background search for a new ip address when the event stream keeps failing
+        self.discovery     = None
+        self.relocated     = Event()
+
+        # One pooled keep-alive session for all REST calls to this bridge (sensors and services included)
+        self.session       = self.__session()
+
         try:
             self.username      = username or self.__username()
-            self.devices       = self.__devices()
+            self.session.headers["hue-application-key"] = self.username
 
-            self.sensors       = [ Sensor(device["id"], device["name"], self) for device in self.devices if device["product_name"] == "Hue motion sensor" ]
+            self.__bootstrap()
         except:
             raise
 
@@ -1004,6 +2881,49 @@ class Bridge():
         self.product_name  = "Hue Bridge"
         self.id, self.name = ([ (device["id"], device["name"]) for device in self.devices if device["product_name"] == self.product_name ] or [ (None, None) ])[0]
 
+        self.__index()
+
+    def __session(self):
+        # Keep the TLS connections to the bridge open instead of a new handshake per request
+        session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOLSIZE, max_retries=0)
+        session.mount("https://", adapter)
+
+        session.hooks["response"].append(self.__observe)
+
+        return session
+
+    def __observe(self, response, *args, **kwargs):
+        # REST latency per endpoint (without resource ids)
+        endpoint = "/".join(response.request.path_url.split("?")[0].split("/")[:5])
+        METRICS.observe("hue_rest_seconds", response.elapsed.total_seconds(), self.labels + (("endpoint", endpoint),))
+
+    def close(self):
+        self.session.close()
+
+    def rediscover(self):
+        # The bridge may have got a new ip address (DHCP): search for it in the background
+        if self.discovery and self.discovery.is_alive():
+            return
+
+        self.discovery = Thread(target=self.__rediscover, name=f"{self.name} discovery", daemon=True)
+        self.discovery.start()
+
+    def __rediscover(self):
+        settings = CONFIG.bridge(self.section) or HUEsettings
+
+        log("ip_discovery")
+        ip = discover_bridge((self.ip, settings["ip"], settings["last_ip"]), exclude=other_bridges(self.section))
+
+        if ip and ip != self.ip:
+            log("ip_discovered", argument=ip)
+            self.ip = ip
+            save_ip(CONFIG.parser, ip, self.section)
+
+            # Reconnect the event stream right away
+            self.relocated.set()
+
     def __username(self):
         # if no user name /API key is specified, we'll create one
         url = f"https://{self.ip}/api"
@@ -1017,7 +2937,7 @@ class Bridge():
         # do this endlessly until successful (i.e. someone pressed the button)
         while(username is None):
             try:
-                response = requests.post(url, json=my_obj, timeout=3, verify=False)
+                response = self.session.post(url, json=my_obj, timeout=RESTTIMEOUT, verify=False)
 
                 if response and response.status_code == 200:
                     data = response.json()[0]
@@ -1035,25 +2955,51 @@ class Bridge():
 
         return username
 
-    def __devices(self):
+    def __bootstrap(self):
+        # Build devices, sensors and services from one snapshot of all resources on the bridge
+        # instead of 2 requests per service. Falls back to single requests if the snapshot fails
+        try:
+            resources = self.__resources()
+        except Exception as e:
+            log("exception", argument=type(e).__name__)
+            resources = None
+
+        self.devices = self.__devices(resources)
+        self.sensors = [ Sensor(device["id"], device["name"], self, resources) for device in self.devices if device["product_name"] == "Hue motion sensor" ]
+
+    def __resources(self):
+        # All resources (devices, services, their states) in a single request: id -> resource
+        url = f"https://{self.ip}/clip/v2/resource"
+
+        response = self.session.get(url, timeout=RESTTIMEOUT, verify=False)
+
+        if response.status_code != 200:
+            log("invalid_response", argument=url)
+            response.raise_for_status()
+
+        return { resource["id"]: resource for resource in response.json()["data"] }
+
+    def __devices(self, resources=None):
         url = f"https://{self.ip}/clip/v2/resource/device"
-        headers = { "hue-application-key": self.username }
 
         device_parms = []
 
         try:
-            response = requests.get(url, headers=headers, timeout=3, verify=False)
+            if resources:
+                devices = [ resource for resource in resources.values() if resource.get("type") == "device" ]
+            else:
+                response = self.session.get(url, timeout=RESTTIMEOUT, verify=False)
 
-            if response.status_code == 200:
-                devices = response.json()["data"]
+                if response.status_code == 200:
+                    devices = response.json()["data"]
+                else:
+                    log("invalid_response", argument=url)
+                    response.raise_for_status()
 
-                for device in devices:
-                    if "product_data" and "metadata" in device.keys():
-                        device_parm = dict(zip(["id", "product_name", "name"], [device["id"], device["product_data"]["product_name"], device["metadata"]["name"]]))
-                        device_parms.append(device_parm)
-            else:
-                log("invalid_response", argument=url)
-                response.raise_for_status()
+            for device in devices:
+                if "product_data" and "metadata" in device.keys():
+                    device_parm = dict(zip(["id", "product_name", "name"], [device["id"], device["product_data"]["product_name"], device["metadata"]["name"]]))
+                    device_parms.append(device_parm)
 
         except:
             raise
@@ -1061,17 +3007,139 @@ class Bridge():
         return device_parms
 
     def reset(self):
-        self.devices = self.__devices()
-
         for sensor in self.sensors:
            for service in sensor.services:
                 del service
            del sensor
 
-        self.sensors = [ Sensor(device["id"], device["name"], self) for device in self.devices if device["product_name"] == "Hue motion sensor" ]
+        self.__bootstrap()
+
+        self.__index()
+
+    def __index(self):
+        # Lookup tables for event dispatch, rebuilt whenever the sensor list changes:
+        # owner rid -> sensor, (owner rid, rtype) -> service, service rid -> service
+        self.sensor_index  = {}
+        self.service_index = {}
+        self.rid_index     = {}
+
+        for sensor in self.sensors:
+            self.sensor_index[sensor.id] = sensor
+
+            for service in sensor.services:
+                self.service_index[(sensor.id, service.name)] = service
+                self.rid_index[service.id] = service
+
+    def parse(self, event_data):
+        # Route a single update item to its service. Returns (sensor, service, changed, value) or None if dropped
+        try:
+            if "owner" in event_data:
+                service = self.service_index.get((event_data["owner"]["rid"], event_data["type"]))
+            else:
+                service = self.rid_index.get(event_data.get("id"))
+
+            if not service or not service.section_name in event_data:
+                return None
+
+            if service.report_name in event_data[service.section_name]:
+                service_data = event_data[service.section_name][service.report_name]
+            else:
+                service_data = event_data[service.section_name]
+
+            if service.value_name in service_data.keys():
+                value = service_data[service.value_name]
+            else:
+                value = None
+
+            if "changed" in service_data.keys():
+                changed = parse_time(service_data["changed"])
+            else:
+                changed = datetime.datetime.now()
+
+        except (KeyError, TypeError, ValueError, AttributeError):
+            return None
+
+        return service.owner, service, changed, value
+
+    def dispatch(self, event_data):
+        start = time.perf_counter()
+        METRICS.inc("hue_events_received_total", self.labels)
+
+        parsed = self.parse(event_data)
+        if not parsed:
+            METRICS.inc("hue_events_dropped_total", self.labels)
+            return None
+
+        sensor, service, changed, value = parsed
+
+        parsed = time.perf_counter()
+
+        if self.onchange:
+            self.onchange(self, sensor, service, changed, value)
+
+        notified = time.perf_counter()
+        service.update(changed, value)
+        updated = time.perf_counter()
+        log(service.prompt())
+        end = time.perf_counter()
+
+        METRICS.inc("hue_events_dispatched_total", service.labels)
+        METRICS.observe("hue_dispatch_seconds", end - start, self.labels)
+
+        if TIMERS.enabled:
+            TIMERS.lap(("events.parse", "events.on_change", "events.update", "events.log"), (start, parsed, notified, updated, end))
+
+        return service
+
+    def frame(self, line, read):
+        # One line of the event stream (requests or aiohttp), False if it is not a data frame.
+        # read: the time the frame was awaited from (incl. waiting for the bridge)
+        if not line.startswith("data:"):
+            return False
+
+        start = time.perf_counter()
+        data = json.loads(line.split(":", 1)[1].strip())
+        decoded = time.perf_counter()
+        METRICS.observe("hue_json_decode_seconds", decoded - start, self.labels)
+
+        if TIMERS.enabled:
+            TIMERS.lap(("events.read", "events.json"), (read, start, decoded))
+
+        # A single frame may bundle several containers with several updates each
+        for container in data:
+            if not "update" == container.get("type"):
+                continue
+
+            for event_data in container.get("data", []):
+                self.dispatch(event_data)
+
+        return True
+
+    def opened(self, retries):
+        METRICS.inc("hue_stream_connects_total", self.labels)
+        METRICS.set("hue_stream_retries_left", retries, self.labels)
+
+    def failed(self, retries):
+        # A failed attempt to open or read the event stream: returns the attempts left.
+        # The ip address is rediscovered after REDISCOVERY failed attempts in a row
+        retries -= 1
+
+        METRICS.inc("hue_stream_errors_total", self.labels)
+        METRICS.set("hue_stream_retries_left", retries, self.labels)
+
+        if MAXRETRIES - retries >= REDISCOVERY:
+            self.rediscover()
+
+        return retries
 
     def events(self):
-        url = f"https://{self.ip}/eventstream/clip/v2"
+        # Use the asyncio client if requested and available, else the blocking requests client
+        if self.asynchronous:
+            asyncio.run(self.events_async())
+        else:
+            self.__events()
+
+    def __events(self):
         headers = {
             "hue-application-key": self.username,
             "Accept": "text/event-stream"
@@ -1080,53 +3148,24 @@ class Bridge():
         with requests.Session() as session:
             retries = MAXRETRIES
             while(retries):
+                # The ip address may change while retrying
+                url = f"https://{self.ip}/eventstream/clip/v2"
+
+                # False until the bridge answered the request: a timeout before is a failed attempt
+                connected = False
+
                 try:
                     response = session.get(url, headers=headers, timeout=TIMEOUT, stream=True, verify=False)
+                    connected = True
 
                     if response and response.status_code == 200:
+                        self.opened(retries)
+
+                        read = time.perf_counter()
+
                         for line in response.iter_lines():
-                            if line:
-                                line = line.decode('utf-8')
-
-                                if line.startswith("data:"):
-                                    data = json.loads(line.split(":", 1)[1].strip())
-                                    if not "update" == data[0]["type"]:
-                                        continue
-
-                                    event_data = data[0]["data"][0]
-                                    if not "owner" in event_data.keys():
-                                        continue
-
-                                    owner_id = event_data["owner"]["rid"]
-                                    sensor = ([ s for s in self.sensors if s.id == owner_id ] or [None])[0]
-                                    if not sensor:
-                                        continue
-
-                                    service_name = event_data["type"]
-                                    service = ([ s for s in sensor.services if s.name == service_name ] or [None])[0]
-                                    if not service:
-                                        continue
-
-                                    if service.report_name in event_data[service.section_name]:
-                                        service_data = event_data[service.section_name][service.report_name]
-                                    else:
-                                        service_data = event_data[service.section_name]
-
-                                    if service.value_name in service_data.keys():
-                                        value = service_data[service.value_name]
-                                    else:
-                                        value = None
-
-                                    if "changed" in service_data.keys():
-                                        changed = utc2local(datetime.datetime.strptime(service_data["changed"], date_in_format))
-                                    else:
-                                        changed = datetime.datetime.now()
-
-                                    if self.onchange:
-                                        self.onchange(self, sensor, service, changed, value)
-
-                                    service.update(changed, value)
-                                    log(service.prompt())
+                            if line and self.frame(line.decode('utf-8'), read):
+                                read = time.perf_counter()
                     else:
                         log("invalid_response", argument=url)
 
@@ -1141,25 +3180,92 @@ class Bridge():
 
                 # recommended reading: https://oxylabs.io/blog/python-requests-timeout
                 except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.RequestException) as e:
-                    if "timed out" in str(e):
+                    # No events within TIMEOUT secs.: reconnect at once. A connect timeout counts as a failed attempt,
+                    # an old address which drops the packets instead of refusing the connection leads to a rediscovery too
+                    if connected and "timed out" in str(e):
                         #log("timeout", argument=url)
                         continue
-                    else:
-                        retries -= 1
 
-                        if retries:
-                            time.sleep(WAITTIME)
-                            continue
-                        else: # raise the exception when max attempts were made
-                            raise
+                    retries = self.failed(retries)
 
-                except:
-                    raise
+                    if retries:
+                        self.relocated.wait(WAITTIME)
+                        self.relocated.clear()
+                        continue
+                    else: # raise the exception when max attempts were made
+                        raise
+
+    def connect_async(self):
+        # One pooled keep-alive connection for REST calls next to the one held by the event stream
+        aiohttp   = aiohttp_client()
+        connector = aiohttp.TCPConnector(ssl=False, limit=2, keepalive_timeout=TIMEOUT)
+        self.async_session = aiohttp.ClientSession(connector=connector, headers={ "hue-application-key": self.username })
+
+        return self.async_session
+
+    async def close_async(self):
+        if self.async_session:
+            await self.async_session.close()
+            self.async_session = None
+
+    async def events_async(self):
+        aiohttp = aiohttp_client()
+        headers = { "Accept": "text/event-stream" }
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=TIMEOUT, sock_read=TIMEOUT)
+
+        if not self.async_session:
+            self.connect_async()
+
+        try:
+            retries = MAXRETRIES
+            while(retries):
+                # The ip address may change while retrying
+                url = f"https://{self.ip}/eventstream/clip/v2"
+
+                connected = False
+
+                try:
+                    async with self.async_session.get(url, headers=headers, timeout=timeout) as response:
+                        connected = True
+
+                        if response.status == 200:
+                            self.opened(retries)
+
+                            read = time.perf_counter()
+
+                            async for line in response.content:
+                                if self.frame(line.decode('utf-8').strip(), read):
+                                    read = time.perf_counter()
+                        else:
+                            log("invalid_response", argument=url)
+
+                    # Reset retry counter after successful request
+                    retries = MAXRETRIES
+
+                # aiohttp's ServerTimeoutError is an asyncio.TimeoutError too: only the timeouts of the
+                # established stream are not counted, connect timeouts are failed attempts
+                except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+                    if connected and isinstance(e, asyncio.TimeoutError):
+                        continue
+
+                    retries = self.failed(retries)
+
+                    if retries:
+                        await asyncio.get_running_loop().run_in_executor(None, self.relocated.wait, WAITTIME)
+                        self.relocated.clear()
+                        continue
+                    else: # raise the exception when max attempts were made
+                        raise
+
+        finally:
+            await self.close_async()
 
 
 class Sensor():
 
-    def __init__(self, id, name, owner):
+    __slots__ = ("id", "name", "owner", "product_name", "services")
+
+    def __init__(self, id, name, owner, resources=None):
         self.id           = id
 
         # This is the invidual name the sensor was given in the Hue app
@@ -1171,34 +3277,37 @@ class Sensor():
         # We'll need to customize this if name changes
         self.product_name = "Hue motion sensor"
 
-        self.__ip         = owner.ip
-        self.__username   = owner.username
+        self.services     = self.__services(resources)
 
-        self.services     = self.__services()
+    @property
+    def settings(self):
+        # Indivisual settings from the current config - else defaults
+        return CONFIG.sensor(self.name)
 
-        # Read indivisual settings from config file - else use dafaults
-        self.settings     = read_sensor_config(self.name)
-
-    def __services(self):
-        url = f"https://{self.__ip}/clip/v2/resource/device/{self.id}"
-        headers = { "hue-application-key": self.__username }
+    def __services(self, resources=None):
+        # Taken from the bridge's resource snapshot if available, else queried per device
+        url = f"https://{self.owner.ip}/clip/v2/resource/device/{self.id}"
 
         service_list = []
 
         try:
-            response = requests.get(url, headers=headers, timeout=3, verify=False)
+            if resources and self.id in resources:
+                device = resources[self.id]
+            else:
+                response = self.owner.session.get(url, timeout=RESTTIMEOUT, verify=False)
 
-            if response and response.status_code == 200:
-                device = response.json()["data"][0]
-                for service in device["services"]:
-                    if service["rtype"] in HueServices:
-                        s = Service(service["rid"], service["rtype"], HueServices[service["rtype"]], self)
-                        service_list.append(s)
-                    else:
-                        continue
+                if response and response.status_code == 200:
+                    device = response.json()["data"][0]
+                else:
+                    log("invalid_response", argument=url)
+                    return service_list
 
-            else:
-                log("invalid_response", argument=url)
+            for service in device["services"]:
+                if service["rtype"] in CONFIG.services:
+                    s = Service(service["rid"], service["rtype"], CONFIG.services[service["rtype"]], self, resources.get(service["rid"]) if resources else None)
+                    service_list.append(s)
+                else:
+                    continue
 
         except Exception as e:
             log("exception", argument=type(e).__name__)
@@ -1210,7 +3319,10 @@ class Sensor():
 
 class Service():
 
-    def __init__(self, id, name, properties, owner):
+    __slots__ = ("id", "name", "description", "section_name", "report_name", "value_name", "unit", "owner",
+                 "enabled", "data", "last_saved", "compressor", "labels")
+
+    def __init__(self, id, name, properties, owner, resource=None):
         self.id = id
         self.name = name
 
@@ -1221,39 +3333,66 @@ class Service():
         self.unit         = properties["unit"]
 
         self.owner        = owner
+        self.labels       = (("bridge", owner.owner.section), ("sensor", owner.name), ("service", name))
 
-        self.__ip         = owner.owner.ip # bridge.ip()
-        self.__username   = owner.owner.username # bridge.username()
+        # Initial state from the resource snapshot if given, else queried from the bridge
+        self.enabled      = resource.get("enabled") if resource else self.is_enabled()
 
-        self.__url        = f"https://{self.__ip}/clip/v2/resource/{self.name}/{self.id}"
-        self.__headers    = {"hue-application-key": self.__username}
+        self.data         = TimeSeries(properties["type"], CONFIG.data["capacity"])
+        self.last_saved   = None
 
-        self.enabled      = self.is_enabled()
+        # Lossy compression at ingestion if configured, never for motion (bool) services
+        compression       = properties["compression"]
+        self.compressor   = Compressor(*compression) if compression and properties["type"] is not bool else None
 
-        self.data         = []
-        self.last_saved   = None
-        self.update()
+        if resource and self.section_name in resource:
+            self.update(*self.__state(resource))
+        else:
+            self.update()
+
+    @property
+    def __url(self):
+        # Follows the bridge if its ip address changes
+        return f"https://{self.owner.owner.ip}/clip/v2/resource/{self.name}/{self.id}"
 
     def prompt(self):
         if not self.data:
             return f"{datetime.datetime.now().strftime(date_out_format)} {self.owner.name} {self.description}: N/A"
 
-        changed, value = self.data[-1]
+        changed, value = self.latest()
 
         if self.unit:
-            return f"{changed.strftime(date_out_format)} {self.owner.name} {self.description}: {value if not isinstance(value, bool) else REPORTsettings['on'] if value else REPORTsettings['off']} {self.unit}"
+            return f"{changed.strftime(date_out_format)} {self.owner.name} {self.description}: {value if not isinstance(value, bool) else CONFIG.report['on'] if value else CONFIG.report['off']} {self.unit}"
         else:
-            return f"{changed.strftime(date_out_format)} {self.owner.name} {self.description}: {value if not isinstance(value, bool) else REPORTsettings['on'] if value else REPORTsettings['off']}"
+            return f"{changed.strftime(date_out_format)} {self.owner.name} {self.description}: {value if not isinstance(value, bool) else CONFIG.report['on'] if value else CONFIG.report['off']}"
+
+    def latest(self):
+        # Last received (datetime, value): the compressor may hold a point which is not stored yet
+        if self.compressor and self.compressor.held:
+            epoch, value = self.compressor.held
+            return epoch2local(epoch), value
+
+        return self.data[-1]
+
+    def flush(self):
+        # Store the point held back by the compressor, e.g. before the report
+        if self.compressor:
+            for epoch, value in self.compressor.flush():
+                self.__store(epoch, value)
 
     def reset(self):
-        self.data = []
+        self.data.clear()
+
+        if self.compressor:
+            self.compressor.reset()
+
         self.update()
 
     def is_enabled(self):
         enabled = None
 
         try:
-            response = requests.get(self.__url, headers=self.__headers, timeout=3, verify=False)
+            response = self.owner.owner.session.get(self.__url, timeout=RESTTIMEOUT, verify=False)
 
             if response and response.status_code == 200:
                 data = response.json()["data"][0]
@@ -1273,7 +3412,7 @@ class Service():
             return False
 
         try:
-            response = requests.put(self.__url, json={"enabled": set}, headers=self.__headers, timeout=3, verify=False)
+            response = self.owner.owner.session.put(self.__url, json={"enabled": set}, timeout=RESTTIMEOUT, verify=False)
 
             if response and response.status_code == 200:
                 self.enabled = set
@@ -1287,29 +3426,33 @@ class Service():
 
         return False
 
+    def __state(self, data):
+        # Extract (changed, value) from the resource data of this service
+        if self.report_name in data[self.section_name].keys():
+            service_data = data[self.section_name][self.report_name]
+        else:
+            service_data = data[self.section_name]
+
+        if self.value_name in service_data.keys():
+            value = service_data[self.value_name]
+        else:
+            value = None
+
+        if "changed" in service_data.keys():
+            changed = parse_time(service_data["changed"])
+        else:
+            changed = datetime.datetime.now()
+
+        return changed, value
+
     def update(self, changed=None, value=None):
         # query latest knwon state or set state if specified
         if changed is None or value is None:
             try:
-                response = requests.get(self.__url, headers=self.__headers, timeout=3, verify=False)
+                response = self.owner.owner.session.get(self.__url, timeout=RESTTIMEOUT, verify=False)
 
                 if response and response.status_code == 200:
-                    data = response.json()["data"][0]
-
-                    if self.report_name in data[self.section_name].keys():
-                        service_data = data[self.section_name][self.report_name]
-                    else:
-                        service_data = data[self.section_name]
-
-                    if self.value_name in service_data.keys():
-                        value = service_data[self.value_name]
-                    else:
-                        value = None
-
-                    if "changed" in service_data.keys():
-                        changed = utc2local(datetime.datetime.strptime(service_data["changed"], date_in_format))
-                    else:
-                        changed = datetime.datetime.now()
+                    changed, value = self.__state(response.json()["data"][0])
 
                 else:
                     log("invalid_response", argument=self.__url)
@@ -1321,11 +3464,506 @@ class Service():
                 log("no_update_service", argument=self.name)
                 return
 
-        if not self.data or changed > self.data[-1][0]:
-            self.data.append((changed, value))
+        if value is None:
+            return
+
+        epoch = local2epoch(changed)
+
+        last = self.data.last()
+        if last is not None and epoch <= last:
+            return
+
+        # Only the points kept by the compressor are stored, journaled and written to the database
+        if self.compressor:
+            for epoch, value in self.compressor.feed(epoch, value):
+                self.__store(epoch, value)
+        else:
+            self.__store(epoch, value)
+
+        return
+
+    def __store(self, epoch, value):
+        self.data.append(epoch, value)
+
+        if self.owner.owner.journal:
+            self.owner.owner.journal.append(self.id, epoch, value)
+
+        if self.owner.owner.database:
+            self.owner.owner.database.insert(self.owner.id, self.id, epoch, value)
+
+    async def enable_async(self, set=True):
+        if self.enabled is None: # service == device_power?
+            return False
+
+        try:
+            async with self.owner.owner.async_session.put(self.__url, json={"enabled": set}, timeout=aiohttp_client().ClientTimeout(total=3)) as response:
+                if response.status == 200:
+                    self.enabled = set
+                    return True
+                else:
+                    log("invalid_response", argument=self.__url)
+
+        except Exception as e:
+            log("exception", argument=type(e).__name__)
+
+        return False
+
+
+class Compressor():
+    # Lossy compression of a service's points at ingestion. feed() returns the points to be stored:
+    #  deadband:     a point is stored if it differs from the last stored value by more than the tolerance
+    #  swingingdoor: the last received point is stored when a straight line from the last stored point
+    #                can no longer pass all points received since within the tolerance
+    # A point is always stored after heartbeat secs. (0 = never). The tolerance is absolute or relative
+    # to the last stored value
+
+    __slots__ = ("method", "tolerance", "relative", "heartbeat", "archived", "held", "upper", "lower", "received", "stored")
+
+    methods = ("deadband", "swingingdoor")
+
+    def __init__(self, method, tolerance, relative=False, heartbeat=0):
+        self.method    = method
+        self.tolerance = tolerance
+        self.relative  = relative
+        self.heartbeat = heartbeat
+
+        self.reset()
+
+    def reset(self):
+        self.archived = None     # last stored (epoch, value)
+        self.held     = None     # last received (epoch, value) if not stored
+        self.upper    = None     # slopes of the swinging doors
+        self.lower    = None
+        self.received = 0
+        self.stored   = 0
+
+    def __archive(self, *points):
+        self.archived = points[-1]
+        self.held     = None
+        self.upper    = self.lower = None
+        self.stored  += len(points)
+        return points
+
+    def __doors(self, epoch, value):
+        # Narrow the doors pivoting at the last stored value +/- tolerance, False if they are closed
+        t0, v0 = self.archived
+        tol = abs(v0) * self.tolerance if self.relative else self.tolerance
+        upper = (value - v0 - tol) / (epoch - t0)
+        lower = (value - v0 + tol) / (epoch - t0)
+
+        self.upper = upper if self.upper is None else max(self.upper, upper)
+        self.lower = lower if self.lower is None else min(self.lower, lower)
+
+        return self.upper <= self.lower
+
+    def feed(self, epoch, value):
+        last = self.held or self.archived
+        if last and epoch <= last[0]:
+            return ()
+
+        self.received += 1
+
+        if self.archived is None:
+            return self.__archive((epoch, value))
+
+        if self.heartbeat and epoch - self.archived[0] >= self.heartbeat:
+            return self.__archive(*filter(None, (self.held, (epoch, value))))
+
+        if self.method == "deadband":
+            v0 = self.archived[1]
+            if abs(value - v0) > (abs(v0) * self.tolerance if self.relative else self.tolerance):
+                return self.__archive((epoch, value))
+
+        elif not self.__doors(epoch, value):
+            # Doors closed: store the previous point and swing the doors from there
+            points = self.__archive(self.held)
+            self.__doors(epoch, value)
+            self.held = (epoch, value)
+            return points
+
+        self.held = (epoch, value)
+        return ()
+
+    def flush(self):
+        return self.__archive(self.held) if self.held else ()
+
+
+class TimeSeries():
+    # Compact (datetime, value) series: epoch seconds and values are kept in typed arrays.
+    # The stream thread appends while the timer and report threads read, reset or replace the
+    # points: all access to the two arrays is serialized by the lock to keep them in step
+
+    __slots__ = ("times", "values", "type", "capacity", "lock")
+
+    typecodes = { bool: "b", int: "l", float: "d" }
+
+    def __init__(self, type=float, capacity=0):
+        self.type     = type
+        self.capacity = capacity
+        self.times    = array("d")
+        self.values   = array(self.typecodes[type])
+        self.lock     = threading.RLock()
+
+    def __getstate__(self):
+        # Copies are passed to the report process, the lock is not
+        return self.type, self.capacity, self.times, self.values
+
+    def __setstate__(self, state):
+        self.type, self.capacity, self.times, self.values = state
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        with self.lock:
+            if isinstance(index, slice):
+                return [ (epoch2local(t), self.type(v)) for t, v in zip(self.times[index], self.values[index]) ]
+
+            return epoch2local(self.times[index]), self.type(self.values[index])
+
+    def __iter__(self):
+        with self.lock:
+            points = list(zip(self.times, self.values))
+
+        for t, v in points:
+            yield epoch2local(t), self.type(v)
+
+    def last(self):
+        # Epoch of the last point, None if empty
+        with self.lock:
+            return self.times[-1] if self.times else None
+
+    def append(self, epoch, value):
+        # Ring buffer mode: drop the oldest eighth of the points when full (amortized O(1))
+        with self.lock:
+            if self.capacity and len(self.times) >= self.capacity:
+                drop = max(1, self.capacity // 8)
+                del self.times[:drop]
+                del self.values[:drop]
+
+            self.times.append(epoch)
+            self.values.append(self.type(value))
+
+    def extend(self, items):
+        # Append (datetime, value) pairs
+        with self.lock:
+            for changed, value in items:
+                self.append(local2epoch(changed), value)
+
+    def load(self, rows):
+        # Append (epoch, value) pairs
+        with self.lock:
+            for epoch, value in rows:
+                self.append(epoch, value)
+
+    def rows(self):
+        # (epoch, value) pairs
+        with self.lock:
+            return list(zip(self.times, self.values))
+
+    def assign(self, times, values):
+        # Replace all points by the given sequences of epochs and values
+        with self.lock:
+            self.clear()
+            self.times.extend(times)
+            self.values.extend(self.type(value) for value in values)
+
+            if self.capacity and len(self.times) > self.capacity:
+                del self.times[:-self.capacity]
+                del self.values[:-self.capacity]
+
+    def merge(self, rows):
+        # Merge (epoch, value) pairs in any order, existing points win on equal times
+        with self.lock:
+            merged = dict(zip(self.times, self.values))
+
+            for epoch, value in rows:
+                merged.setdefault(epoch, value)
+
+            self.clear()
+            self.load(sorted(merged.items()))
+
+    def clear(self):
+        with self.lock:
+            del self.times[:]
+            del self.values[:]
+
+    def copy(self):
+        series = TimeSeries(self.type, self.capacity)
+
+        with self.lock:
+            series.times.extend(self.times)
+            series.values.extend(self.values)
+
+        return series
+
+    def between(self, start=None, end=None):
+        # Points with start < time <= end, found by bisection
+        with self.lock:
+            first = bisect.bisect_right(self.times, local2epoch(start)) if start else 0
+            last  = bisect.bisect_right(self.times, local2epoch(end)) if end else len(self.times)
+
+            return self[first:last]
+
+    def since(self, start):
+        return self.between(start)
+
+
+def is_database(path):
+    return bool(path) and os.path.splitext(path)[1].lower() in (".db", ".sqlite", ".sqlite3")
+
+
+class SQLiteStore():
+    # Time series of all services in an SQLite database (WAL mode).
+    # Inserts are buffered and written in batched transactions
+
+    def __init__(self, path, batch=100, interval=5):
+        self.path     = path
+        self.batch    = batch
+        self.interval = interval
+
+        self.pending  = []
+        self.flushed  = time.monotonic()
+        self.lock     = Lock()
+
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        # Used by the event stream and the timer thread, access is serialized by self.lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "sensor TEXT NOT NULL, "
+                "service TEXT NOT NULL, "
+                "epoch REAL NOT NULL, "
+                "value REAL, "
+                "PRIMARY KEY (service, epoch)) WITHOUT ROWID"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS samples_sensor ON samples (sensor, epoch)")
+
+    def insert(self, sensor_id, service_id, epoch, value):
+        with self.lock:
+            self.pending.append((sensor_id, service_id, epoch, float(value)))
+
+            if len(self.pending) >= self.batch or time.monotonic() - self.flushed >= self.interval:
+                self.__flush()
+
+    def flush(self):
+        with self.lock:
+            self.__flush()
+
+    def __flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany("INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?)", self.pending)
+            self.pending = []
+
+        self.flushed = time.monotonic()
+
+    def query(self, service_id, start=None, end=None):
+        # (epoch, value) rows of a service with start <= epoch < end, ordered by time
+        with self.lock:
+            self.__flush()
 
+            return self.connection.execute(
+                "SELECT epoch, value FROM samples WHERE service = ? AND epoch >= ? AND epoch < ? ORDER BY epoch",
+                (service_id, start or 0, end or float("inf"))
+            ).fetchall()
+
+    def times(self, service_id, start=None, end=None):
+        # Epochs of the points with a true/non-zero value (e.g. motion events) with start <= epoch < end
+        with self.lock:
+            self.__flush()
+
+            return [ row[0] for row in self.connection.execute(
+                "SELECT epoch FROM samples WHERE service = ? AND epoch >= ? AND epoch < ? AND value != 0 ORDER BY epoch",
+                (service_id, start or 0, end or float("inf"))
+            ) ]
+
+    def close(self):
+        with self.lock:
+            self.__flush()
+            self.connection.close()
+
+
+class Journal():
+    # Append-only event journal (write-ahead log). Every event is written immediately,
+    # fsync is done for groups of events (group commit) to keep the cost per event low
+
+    journals = {}
+
+    @classmethod
+    def open(cls, path, batch=50, interval=1.0):
+        # Bridges share one journal per path
+        if not path in cls.journals:
+            cls.journals[path] = cls(path, batch, interval)
+
+        return cls.journals[path]
+
+    def __init__(self, path, batch=50, interval=1.0):
+        self.path     = path
+        self.batch    = batch
+        self.interval = interval
+
+        self.pending  = 0
+        self.synced   = time.monotonic()
+        self.lock     = Lock()
+
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        self.file = open(path, "a", encoding="utf-8")
+
+    def append(self, service_id, epoch, value):
+        with self.lock:
+            self.file.write(f"{service_id}\t{epoch!r}\t{json.dumps(value)}\n")
+            self.pending += 1
+
+            if self.pending >= self.batch or time.monotonic() - self.synced >= self.interval:
+                self.__sync()
+
+    def sync(self):
+        with self.lock:
+            self.__sync()
+
+    def __sync(self):
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+        self.synced = time.monotonic()
+
+    def replay(self, start=0):
+        # (service id, epoch, value) of all entries since start. A torn last line is skipped
+        with self.lock:
+            self.file.flush()
+
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        service_id, epoch, value = line.rstrip("\n").split("\t")
+                        epoch = float(epoch)
+                        value = json.loads(value)
+                    except ValueError:
+                        continue
+
+                    if epoch >= start:
+                        yield service_id, epoch, value
+
+    def compact(self, start, services=None):
+        # Drop all entries before start, only those of the given service ids if specified (the
+        # journal may be shared by several bridges). The journal is rewritten and replaced atomically
+        with self.lock:
+            self.__sync()
+
+            temp_path = self.path + ".tmp"
+
+            with open(self.path, encoding="utf-8") as f, open(temp_path, "w", encoding="utf-8") as temp:
+                for line in f:
+                    try:
+                        service_id, epoch = line.split("\t")[:2]
+                        if float(epoch) >= start or (services is not None and not service_id in services):
+                            temp.write(line)
+                    except ValueError:
+                        continue
+
+                temp.flush()
+                os.fsync(temp.fileno())
+
+            os.replace(temp_path, self.path)
+
+            self.file.close()
+            self.file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self.lock:
+            self.__sync()
+            self.file.close()
+
+
+def report_journal(bridge):
+    # Entries of days before today are left in the journal if the monitor was stopped or crashed on
+    # that day and restarted after midnight. They are stored and reported day by day, only then the
+    # entries of this bridge are dropped from the journal
+    global  today
+
+    start = local2epoch(datetime.datetime.strptime(today, day_format))
+    days  = {}
+
+    try:
+        for service_id, epoch, value in bridge.journal.replay():
+            if epoch < start and service_id in bridge.rid_index:
+                days.setdefault(epoch2local(epoch).strftime(day_format), {}).setdefault(service_id, []).append((epoch, value))
+
+    except Exception as e:
+        log(str(e))
+        return
+
+    current = today
+    success = True
+
+    for day in sorted(days, key=lambda day: datetime.datetime.strptime(day, day_format)):
+        log("journal_replayed", argument=day)
+
+        for sensor in bridge.sensors:
+            for service in sensor.services:
+                service.data.clear()
+
+        for service_id, service_rows in days[day].items():
+            service = bridge.rid_index[service_id]
+            service.data.merge(service_rows)
+
+            if bridge.database:
+                for epoch, value in service_rows:
+                    bridge.database.insert(service.owner.id, service_id, epoch, value)
+
+        # The report is created for the replayed day
+        today = day
+
+        try:
+            success = report(bridge) and success
+        finally:
+            today = current
+
+    if days:
+        # Back to the current state of the services
+        for sensor in bridge.sensors:
+            for service in sensor.services:
+                service.reset()
+
+        # Keep the entries for the next start if a report failed
+        if success:
+            bridge.journal.compact(start, services=set(bridge.rid_index))
+
+
+def read_journal(bridge):
+    # Replay today's journal entries into the services. Points restored from the store are kept
+    start = local2epoch(datetime.datetime.strptime(today, day_format))
+    rows  = {}
+
+    try:
+        for service_id, epoch, value in bridge.journal.replay(start):
+            if service_id in bridge.rid_index:
+                rows.setdefault(service_id, []).append((epoch, value))
+
+    except Exception as e:
+        log(str(e))
         return
 
+    for service_id, service_rows in rows.items():
+        service = bridge.rid_index[service_id]
+        service.data.merge(service_rows)
+
+        if bridge.database:
+            for epoch, value in service_rows:
+                bridge.database.insert(service.owner.id, service_id, epoch, value)
+
 
 class MyTimer(Timer):
     def run(self):
@@ -1333,26 +3971,98 @@ class MyTimer(Timer):
              self.function(*self.args, **self.kwargs)
 
 
-def timer_event(bridge):
+def daily_report(bridge):
+    # Report the passed day. Entries of the reported day are no longer needed in the journal
+    if report(bridge, reset=True) and bridge.journal:
+        bridge.journal.compact(local2epoch(datetime.datetime.combine(datetime.date.today(), datetime.time())), services=set(bridge.rid_index))
+
+
+def next_day():
     global  today
 
-    # Let's see if a day has passed. It's time to send a new report and set the date
-    if datetime.datetime.now().strftime(day_format) != today:
-        report(bridge, reset=True)
-        today = datetime.datetime.now().strftime(day_format)
+    today = datetime.datetime.now().strftime(day_format)
+    log("alerts", argument=ALERTS.status())
+    log("notifications", argument=NOTIFIER.status())
+
+
+def flush_stores(*bridges):
+    # Write buffered inserts if the event stream is quiet
+    for bridge in bridges:
+        if bridge.database:
+            bridge.database.flush()
+
+
+def scheduled(*bridges):
+    # (service, enable) of the services to be suspended or re-enabled according to the schedules of their sensors
+    for bridge in bridges:
+        for sensor in bridge.sensors:
+            if sensor.settings["suspend"]:
+                suspend = datetime.datetime.now() in sensor.settings["schedule"]
 
-    for sensor in bridge.sensors:
-        if sensor.settings["suspend"]:
-            if check_date(datetime.datetime.now().strftime(date_out_format), sensor.settings["except"]) or check_date(datetime.datetime.now().strftime(time_format), sensor.settings["except_daily"], daily=True):
-                for service in sensor.services:
-                    if service.enabled:
-                       if service.enable(False):
-                            log("suspended", argument=service.name)
-            else:
                 for service in sensor.services:
-                    if service.enabled is False:
-                        if service.enable():
-                            log("enabled", argument=service.name)
+                    if suspend and service.enabled:
+                        yield service, False
+                    elif not suspend and service.enabled is False:
+                        yield service, True
+
+
+def timer_event(*bridges):
+    # Let's see if a day has passed. It's time to send a new report (per bridge) and set the date
+    if datetime.datetime.now().strftime(day_format) != today:
+        for bridge in bridges:
+            daily_report(bridge)
+        next_day()
+
+    # Apply changes of the config file
+    reload_config(*bridges)
+
+    # Keep the SMTP session alive or close it if idle
+    MAILER.keepalive()
+
+    flush_stores(*bridges)
+
+    for service, enable in scheduled(*bridges):
+        if service.enable(enable):
+            log("enabled" if enable else "suspended", argument=service.name)
+
+
+async def timer_event_async(*bridges, interval=60):
+    # asyncio counterpart of MyTimer/timer_event: runs on the event loop of the event streams.
+    # The report and smtp are blocking, they are kept off the event loop
+    loop = asyncio.get_running_loop()
+
+    while True:
+        await asyncio.sleep(interval)
+
+        if datetime.datetime.now().strftime(day_format) != today:
+            for bridge in bridges:
+                await loop.run_in_executor(None, daily_report, bridge)
+            next_day()
+
+        reload_config(*bridges)
+
+        await loop.run_in_executor(None, MAILER.keepalive)
+
+        flush_stores(*bridges)
+
+        for service, enable in scheduled(*bridges):
+            if await service.enable_async(enable):
+                log("enabled" if enable else "suspended", argument=service.name)
+
+
+async def monitor_async(*bridges):
+    # Serve the event streams of all bridges and the timer from one event loop
+    timer = asyncio.create_task(timer_event_async(*bridges))
+
+    try:
+        results = await asyncio.gather(*[bridge.events_async() for bridge in bridges], return_exceptions=True)
+
+        # Re-raise the first failure once all streams have ended
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+    finally:
+        timer.cancel()
 
 
 def check(ip):
@@ -1367,51 +4077,109 @@ def check(ip):
         return False
 
 
-def read_csv(bridge):
+def csv_files(bridge):
+    # Map each sensor to its csv file: either the store itself or <store>/<bridge>_<sensor>_<yymmdd>.csv
+    timestamp = today[6:8] + today[3:5] + today[:2] # reverse today's date
+    files = {}
+
+    for sensor in bridge.sensors or []:
+        if os.path.isfile(bridge.store):
+            file_path = bridge.store
+        elif os.path.isdir(bridge.store):
+            file_path = os.path.join(bridge.store, f"{bridge.name}_{sensor.name}_{timestamp}.csv")
+        else:
+            continue
+
+        if os.path.isfile(file_path):
+            files[sensor] = file_path
+
+    return files
+
+
+def restore_sensor(sensor, df):
+    import numpy as np
+
     spos = len(date_out_format.split())
 
-    timestamp = today[6:8] + today[3:5] + today[:2] # reverse today's date
-    file_path = None
+    for service in sensor.services:
+        if service.name == "device_power":
+            continue
 
-    if os.path.isfile(DATAsettings["store"]):
-        file_path = DATAsettings["store"]
+        try:
+            # Filter the rows which match criteria for the specific service: only today's data and source is sensor
+            column = df[service.description]
+            column = column[column.str.startswith(today) & (df[CONFIG.report["source"]] == sensor.name)]
 
-    for sensor in bridge.sensors or []:
+            if column.empty:
+                log("no_data", argument=f"{sensor.name}:{service.description}")
+                continue
 
-        if not file_path and os.path.isdir(DATAsettings["store"]):
-            file_path = f"{bridge.name}_{sensor.name}_{timestamp}.csv"
-            file_path = os.path.join(DATAsettings["store"], file_path)
+            # Cells are "<date> <time> <value> <unit>": timestamps are parsed in one go, values converted as arrays
+            cells  = column.tolist()
+            epochs = parse_local_epochs(cells)
+            values = np.array([ cell.split(" ", spos + 1)[spos] for cell in cells ])
 
-            if not os.path.isfile(file_path):
-                return
+            if service.name == "motion":
+                values = values == CONFIG.report["on"]
+            elif service.name == "temperature":
+                values = values.astype(float)
+            elif service.name == "light_level":
+                values = values.astype(int)
+            else:
+                continue
+
+            service.data.assign(epochs.tolist(), values.tolist())
 
-        df = pd.read_csv(file_path, sep="\t", na_filter=False)
+        except Exception:
+            log("data_read_failed", argument=f"{sensor.name}:{service.description}")
+            continue
+
+        service.last_saved = service.data[-1][0]
+
+        log("data_read_success", argument=f"{sensor.name}:{service.description}")
+
+
+def read_csv(bridge):
+    # Restore today's data from the csv store. Files are loaded and parsed concurrently
+    import pandas as pd
+
+    files = csv_files(bridge)
+    if not files:
+        return
 
+    paths = sorted(set(files.values()))
+
+    with ThreadPoolExecutor(max_workers=min(4, len(paths))) as executor:
+        frames = dict(zip(paths, executor.map(lambda path: pd.read_csv(path, sep="\t", na_filter=False, dtype=str), paths)))
+
+    with ThreadPoolExecutor(max_workers=min(4, len(files))) as executor:
+        for future in [ executor.submit(restore_sensor, sensor, frames[path]) for sensor, path in files.items() ]:
+            future.result()
+
+
+def read_store(bridge):
+    # Restore today's data from the SQLite database: one indexed range query per service
+    start = local2epoch(datetime.datetime.strptime(today, day_format))
+
+    for sensor in bridge.sensors or []:
         for service in sensor.services:
             if service.name == "device_power":
                 continue
 
             try:
-                # Filter the rows which match criteria for the specific service: only today's data and source is sensor
-                df_service = df[df[service.description].str.startswith(today) & (df[REPORTsettings["source"]] == sensor.name)]
-                # Select the filtered column for this specific service
-                service_data = list(df_service[service.description])
+                rows = bridge.database.query(service.id, start)
 
-            except:
+            except Exception:
                 log("data_read_failed", argument=f"{sensor.name}:{service.description}")
                 continue
 
-            if service_data:
-                if service.name == "motion":
-                    service.data = [(datetime.datetime.strptime(" ".join(x.split()[:spos]), date_out_format), True if x.split()[spos] == REPORTsettings["on"] else False) for x in service_data]
-
-                elif service.name == "temperature":
-                    service.data = [(datetime.datetime.strptime(" ".join(x.split()[:spos]), date_out_format), float(x.split()[spos])) for x in service_data]
+            if rows:
+                # Keep the current state (queried at startup) if it is newer than the stored data
+                current = service.data.rows()
 
-                elif service.name == "light_level":
-                    service.data = [(datetime.datetime.strptime(" ".join(x.split()[:spos]), date_out_format), int(x.split()[spos])) for x in service_data]
-
-                service.last_saved = service.data[-1][0]
+                service.data.clear()
+                service.data.load(rows)
+                service.data.load(row for row in current if row[0] > rows[-1][0])
 
                 log("data_read_success", argument=f"{sensor.name}:{service.description}")
 
@@ -1419,15 +4187,21 @@ def read_csv(bridge):
                 log("no_data", argument=f"{sensor.name}:{service.description}")
 
 
-def find_hue_ip():
+def find_hue_ip(found=None, stop=None, timeout=10):
+    # Browse for bridges via mDNS. Announced addresses are passed to found() until stop is set
+    # or the timeout expires. Without a callback the first address found is returned
+    addresses = []
+    stop = stop or Event()
 
-    class MyListener(ServiceListener):
+    if found is None:
+        def found(ip):
+            addresses.append(ip)
+            stop.set()
 
-        def __init__(self):
-            self.service_ip = None
+    class MyListener(ServiceListener):
 
         def update_service(self, zeroconf, service_type, name):
-            pass
+            self.add_service(zeroconf, service_type, name)
 
         def remove_service(self, zeroconf, service_type, name):
             pass
@@ -1436,123 +4210,223 @@ def find_hue_ip():
             info = zeroconf.get_service_info(service_type, name)
 
             if info:
-                addresses = info.parsed_addresses()
-                if addresses:
-                    self.service_ip = addresses[0]
+                for address in info.parsed_addresses():
+                    found(address)
 
     zeroconf = Zeroconf()
-    listener = MyListener()
 
     try:
-        ServiceBrowser(zeroconf, "_hue._tcp.local.", listener)
-
-        retries = 100
-        while not listener.service_ip and retries:
-            time.sleep(.1)
-            retries -= 1
+        ServiceBrowser(zeroconf, "_hue._tcp.local.", MyListener())
+        stop.wait(timeout)
 
     finally:
         zeroconf.close()
 
-    return listener.service_ip
+    return addresses[0] if addresses else None
 
 
-if __name__ == "__main__":
-    # Read settings from config file
-    cfg = read_config()
-    if not cfg:
-        log("no_config")
-        sys.exit(0)
+def discover_bridge(candidates, exclude=(), timeout=DISCOVERYTIMEOUT):
+    # Race all sources for the bridge's ip address: the known addresses (configured, last known good),
+    # mDNS and the cloud endpoint. The first address which responds wins, the other searches are stopped
+    done   = Event()
+    result = []
+    lock   = Lock()
 
-    notify_me(MOTIONsettings["notify_to"], MOTIONsettings["notify_subject"], LOGsettings["monitor_started"], logging=False)
+    def verify(ip):
+        if not ip or ip in exclude or done.is_set():
+            return
 
-    start_time = time.time()
-    while int(time.time() - start_time) < 30:
-        if isOpen(HUEsettings["ip"], 80, 1):
-            break
-        else:
-            time.sleep(5)
+        if check(ip):
+            with lock:
+                if not result:
+                    result.append(ip)
+                    done.set()
 
-    if not check(HUEsettings["ip"]):
-        log("ip_discovery")
+    def probe(ip):
+        # The bridge may still be booting, e.g. after a power failure
+        while not done.is_set():
+            verify(ip)
+            done.wait(PROBEINTERVAL)
+
+    def cloud():
         try:
-            response = requests.get("https://discovery.meethue.com/", verify=False)
+            response = requests.get(DISCOVERYURL, timeout=RESTTIMEOUT, verify=False)
 
             if response and response.status_code == 200:
-                data = response.json()[0]
-                if "internalipaddress" in data.keys():
-                    # If a new ip address was found, save it to the ini file
-                    log("ip_discovered", argument=data["internalipaddress"])
-                    save_ip(cfg, data["internalipaddress"])
-                    HUEsettings["ip"] = data["internalipaddress"]
+                for data in response.json():
+                    verify(data.get("internalipaddress"))
         except:
             pass
 
-    if not check(HUEsettings["ip"]):
-        log("ip_discovery")
-        ip_address = find_hue_ip()
+    sources = [ Thread(target=probe, args=(ip,)) for ip in dict.fromkeys(ip for ip in candidates if ip) ]
+    sources.append(Thread(target=cloud))
+    sources.append(Thread(target=find_hue_ip, args=(verify, done, timeout)))
+
+    for source in sources:
+        source.daemon = True
+        source.start()
+
+    done.wait(timeout)
+    done.set()
 
-        if ip_address:
-            log("ip_discovered", argument=ip_address)
-            save_ip(cfg, ip_address)
-            HUEsettings["ip"] = ip_address
+    with lock:
+        return result[0] if result else None
 
-    if not check(HUEsettings["ip"]):
+
+def other_bridges(section):
+    # Known ip addresses of the bridges in the other config sections
+    return [ ip for settings in CONFIG.bridges if settings["section"] != section for ip in (settings["ip"], settings["last_ip"]) if ip ]
+
+
+def connect_bridge(cfg, settings, asynchronous=False):
+    # Wait for the bridge, discover a new ip address if required and instantiate the bridge
+    # The settings are read-only, a discovered ip address is saved to the config file
+    ip = discover_bridge((settings["ip"], settings["last_ip"]), exclude=other_bridges(settings["section"]))
+
+    if not ip:
         log("no_response")
-        notify_me(MOTIONsettings["notify_to"], MOTIONsettings["notify_subject"], LOGsettings["monitor_not_ready"], logging=False)
-        sys.exit(1)
+        return None
 
-    try:
-        # Instantiate our bridge
-        bridge = Bridge(HUEsettings["ip"], username=HUEsettings["key"], onchange=on_change)
+    # If a new ip address was found, save it to the ini file
+    if not ip in (settings["ip"], settings["last_ip"]):
+        log("ip_discovered", argument=ip)
+        save_ip(cfg, ip, settings["section"])
 
-        # If a new key was created, save it to the ini file
-        if not HUEsettings["key"]:
-            save_key(cfg, bridge.username)
-            HUEsettings["key"] = bridge.username
+    # Instantiate our bridge
+    bridge = Bridge(ip, username=settings["key"], onchange=on_change, asynchronous=asynchronous, store=settings["store"], section=settings["section"])
 
-        # Read today's saved data from csv file(s) - if exist:
-        if DATAsettings["store"]:
-            read_csv(bridge)
+    # If a new key was created, save it to the ini file
+    if not settings["key"]:
+        save_key(cfg, bridge.username, settings["section"])
 
-        # Print the current status of all connected sensors & services
-        if bridge.sensors:
-            for sensor in bridge.sensors:
-                status = []
-                log(f"{sensor.product_name}: {sensor.name}")
+    # Report the days which were not reported before the monitor was stopped
+    if bridge.journal:
+        report_journal(bridge)
 
-                for service in sensor.services:
-                    status.append(service.prompt())
-                    if service.enabled is False:
-                        log("suspended", argument=service.name)
-                        # Enable all suspended services if "suspend" option is set to "no"
-                        if not sensor.settings["suspend"]:
-                            if service.enable():
-                                log("enabled", argument=service.name)
+    # Read today's saved data from the database or from csv file(s) - if exist:
+    if bridge.database:
+        read_store(bridge)
+    elif bridge.store and not CONFIG.data["monitor_only"]:
+        read_csv(bridge)
+
+    # Add the events which were not yet saved when the monitor was stopped
+    if bridge.journal:
+        read_journal(bridge)
+
+    # Print the current status of all connected sensors & services
+    if bridge.sensors:
+        for sensor in bridge.sensors:
+            status = []
+            log(f"{sensor.product_name}: {sensor.name}")
+
+            for service in sensor.services:
+                status.append(service.prompt())
+                if service.enabled is False:
+                    log("suspended", argument=service.name)
+                    # Enable all suspended services if "suspend" option is set to "no"
+                    if not sensor.settings["suspend"]:
+                        if service.enable():
+                            log("enabled", argument=service.name)
 
-                for line in sorted(status):
-                    log(line)
+            for line in sorted(status):
+                log(line)
 
-        timer = MyTimer(60, timer_event, args=(bridge,))
-        timer.start()
+    return bridge
 
-        # Listen for events
-        bridge.events()
+
+def listen(*bridges):
+    # Listen for events of one or more bridges. Several event streams run in threads of this process
+    if len(bridges) == 1:
+        bridges[0].events()
+        return
+
+    failures = []
+
+    def run(bridge):
+        try:
+            bridge.events()
+        except Exception as e:
+            log("exception", argument=type(e).__name__)
+            failures.append(e)
+
+    threads = [ Thread(target=run, args=(bridge,), name=bridge.name, daemon=True) for bridge in bridges ]
+
+    for thread in threads:
+        thread.start()
+
+    # Join with a timeout to keep the main thread responsive to signals
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+
+    if failures:
+        raise failures[0]
+
+
+if __name__ == "__main__":
+    # Read settings from config file
+    cfg = read_config()
+    if not cfg or not CONFIG.bridges:
+        log("no_config")
+        sys.exit(0)
+
+    notify_me(CONFIG.motion["notify_to"], CONFIG.motion["notify_subject"], CONFIG.log["monitor_started"], logging=False)
+
+    # The asyncio client is used for all bridges if enabled for the default bridge
+    asynchronous = CONFIG.hue["async"] and aiohttp_client() is not None
+
+    bridges = []
+    timer = None
+
+    try:
+        for settings in CONFIG.bridges:
+            bridge = connect_bridge(cfg, settings, asynchronous)
+            if bridge:
+                bridges.append(bridge)
+
+        if not bridges:
+            notify_me(CONFIG.motion["notify_to"], CONFIG.motion["notify_subject"], CONFIG.log["monitor_not_ready"], logging=False)
+            sys.exit(1)
+
+        if CONFIG.data["metrics"]:
+            serve_metrics(CONFIG.data["metrics"], bridges)
+
+        if asynchronous:
+            # Listen for events and run the timer on one event loop
+            asyncio.run(monitor_async(*bridges))
+
+        else:
+            # One timer serves all bridges
+            timer = MyTimer(60, timer_event, args=tuple(bridges))
+            timer.start()
+
+            # Listen for events
+            listen(*bridges)
 
     except Exception as e:
         log("exception", argument=type(e).__name__)
         #log("exception", argument=e)
-        notify_me(MOTIONsettings["notify_to"], MOTIONsettings["notify_subject"], LOGsettings["monitor_failed"].format(type(e).__name__), logging=False)
+        notify_me(CONFIG.motion["notify_to"], CONFIG.motion["notify_subject"], CONFIG.log["monitor_failed"].format(type(e).__name__), logging=False)
         sys.exit(1)
 
     finally:
         try:
             # Send report
-            report(bridge)
+            for bridge in bridges:
+                report(bridge)
+
+                if bridge.database:
+                    bridge.database.close()
+
+                if bridge.journal:
+                    bridge.journal.sync()
+
+                bridge.close()
 
-            timer.cancel()
+            if timer:
+                timer.cancel()
         except:
             pass
 
-    notify_me(MOTIONsettings["notify_to"], MOTIONsettings["notify_subject"], LOGsettings["monitor_stopped"], logging=False)
+    notify_me(CONFIG.motion["notify_to"], CONFIG.motion["notify_subject"], CONFIG.log["monitor_stopped"], logging=False)
     sys.exit(0)
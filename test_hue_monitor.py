@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+#
+# Tests of hue_monitor.py without a bridge: python3 -m unittest test_hue_monitor
+#
+
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from types import SimpleNamespace
+from unittest import mock
+
+import hue_monitor
+
+
+def midnight():
+    return hue_monitor.local2epoch(datetime.datetime.combine(datetime.date.today(), datetime.time()))
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal   = hue_monitor.Journal(os.path.join(self.directory.name, "hue_monitor.journal"))
+
+    def tearDown(self):
+        self.journal.close()
+        self.directory.cleanup()
+
+    def bridge(self, *service_ids):
+        return SimpleNamespace(journal=self.journal, rid_index={ service_id: None for service_id in service_ids }, database=None, sensors=[])
+
+    def test_midnight_compaction_keeps_other_bridges(self):
+        # Two bridges share the journal, only the report of bridge a is done
+        a, b = self.bridge("a-temperature"), self.bridge("b-temperature")
+
+        for service_id in ("a-temperature", "b-temperature"):
+            self.journal.append(service_id, midnight() - 60, 20.0)
+            self.journal.append(service_id, midnight() + 60, 21.0)
+
+        with mock.patch.object(hue_monitor, "today", "01.01.00"), \
+             mock.patch.object(hue_monitor, "report", return_value=True), \
+             mock.patch.object(hue_monitor, "reload_config"), \
+             mock.patch.object(hue_monitor.MAILER, "keepalive"):
+            hue_monitor.timer_event(a)
+
+        entries = sorted((service_id, epoch) for service_id, epoch, value in self.journal.replay())
+
+        self.assertEqual(entries, [ ("a-temperature", midnight() + 60), ("b-temperature", midnight() - 60), ("b-temperature", midnight() + 60) ])
+
+
+class TimeSeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        # Switch threads as often as possible
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+
+    def test_append_during_reset(self):
+        # The stream thread appends while the timer thread resets and the report thread copies
+        series = hue_monitor.TimeSeries(float, capacity=64)
+        done   = threading.Event()
+
+        def stream():
+            for epoch in range(200000):
+                series.append(float(epoch), float(epoch))
+            done.set()
+
+        def timer():
+            while not done.is_set():
+                series.clear()
+                series.merge([ (-1.0, -1.0) ])
+                series.copy()
+
+        threads = [ threading.Thread(target=stream), threading.Thread(target=timer) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(series.times), len(series.values))
+        self.assertTrue(all(epoch == value for epoch, value in series.rows()))
+
+
+if __name__ == "__main__":
+    unittest.main()